@@ -0,0 +1,77 @@
+"""Alias keys for symbol names, shared by ingest (builds symbol_aliases) and rag (resolves phrase concepts).
+
+An alias is a normalized spelling of a display_name, its Ukrainian name or one of its ai_tags,
+so near-miss names from the LLM ("Dont want", "don't want", "хочу") resolve without an encode."""
+
+import difflib
+import re
+
+FUZZY_CUTOFF = 0.88   # difflib ratio needed for a fuzzy alias match
+FUZZY_MIN_LEN = 4     # shorter keys ("I", "me", "no") must match exactly
+
+# alias sources in priority order: a key taken by a higher source is not reused by a lower one
+SOURCES = ("name", "name_uk", "tag")
+
+_APOSTROPHES = str.maketrans({"’": "'", "ʼ": "'", "`": "'"})
+_WORD_RE = re.compile(r"[\w']+")
+_NEGATIONS = {
+    "can't": "can not", "cannot": "can not", "cant": "can not",
+    "won't": "will not", "wont": "will not",
+    "dont": "do not", "doesnt": "does not", "didnt": "did not",
+    "isnt": "is not", "arent": "are not", "wasnt": "was not", "havent": "have not",
+}
+
+
+def normalize(text: str) -> str:
+    """Casefolded words with English negations spelled out: "Don't-want" → "do not want"."""
+    words = []
+    for word in _WORD_RE.findall(text.translate(_APOSTROPHES).casefold()):
+        word = word.strip("'")
+        if word in _NEGATIONS:
+            words.append(_NEGATIONS[word])
+        elif word.endswith("n't"):
+            words.append(f"{word[:-3]} not")
+        elif word:
+            words.append(word)
+    return " ".join(words)
+
+
+def _split_tags(raw: str | None) -> list[str]:
+    return [t.strip() for t in (raw or "").split(",") if t.strip()]
+
+
+def build(rows) -> list[tuple[str, str, str]]:
+    """(alias, symbol_id, source) rows from (symbol_id, display_name, display_name_uk, ai_tags).
+
+    Names that differ only in spelling ("dont want", "do not want") share a key, which goes to
+    one canonical name: the one equal to the key, else the first in sorted order. Tags shared
+    by several symbols ("food", "person") are dropped as ambiguous."""
+    # key → source → display_name → symbol_ids
+    found: dict[str, dict[str, dict[str, set[str]]]] = {}
+    for symbol_id, name, name_uk, ai_tags in rows:
+        spellings = [("name", name), ("name_uk", name_uk)] + [("tag", t) for t in _split_tags(ai_tags)]
+        for source, text in spellings:
+            key = normalize(text or "")
+            if key:
+                found.setdefault(key, {}).setdefault(source, {}).setdefault(name, set()).add(symbol_id)
+
+    aliases = []
+    for key, by_source in found.items():
+        source = next(s for s in SOURCES if s in by_source)
+        names = by_source[source]
+        if len(names) == 1:
+            (symbol_ids,) = names.values()
+        elif source != "tag":
+            symbol_ids = names[key if key in names else min(names)]
+        else:
+            continue
+        aliases.extend((key, sid, source) for sid in sorted(symbol_ids))
+    return aliases
+
+
+def closest(key: str, keys) -> str | None:
+    """Best fuzzy match for a normalized key among `keys`, or None below FUZZY_CUTOFF."""
+    if len(key) < FUZZY_MIN_LEN:
+        return None
+    match = difflib.get_close_matches(key, keys, n=1, cutoff=FUZZY_CUTOFF)
+    return match[0] if match else None
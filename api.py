@@ -0,0 +1,75 @@
+"""Compact JSON responses for native clients: GET /aacbot/api/search in app.py.
+
+Symbols carry ids, both languages and an image URL instead of the inline HTML and base64
+the Gradio UI renders. A body is serialized once, hashed into a weak ETag and compressed
+(brotli when installed and accepted, else gzip) at most once per encoding."""
+
+import gzip
+import hashlib
+import json
+import os
+
+from images import image_url, pick_rendition
+
+API_IMAGE_SIZE = int(os.environ.get("API_IMAGE_SIZE", 96))     # CSS px the image URLs are picked for
+API_MAX_AGE = int(os.environ.get("API_MAX_AGE", 60))           # Cache-Control max-age, seconds
+API_COMPRESS_MIN = int(os.environ.get("API_COMPRESS_MIN", 512))  # smaller bodies go out uncompressed
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # per response, so speed matters more than the last percent
+
+
+def compact(entry: dict, size: int = API_IMAGE_SIZE) -> dict:
+    """A retrieve/retrieve_phrase entry as sent to clients; "role" only for phrase slots."""
+    out = {"role": entry["role"]} if "role" in entry else {}
+    out.update({
+        "id": entry["symbol_id"],
+        "name": entry["display_name"], "name_uk": entry["display_name_uk"],
+        "category": entry["category"], "category_uk": entry["category_uk"],
+        "audience": entry["audience"], "distance": entry["distance"],
+        "image": image_url(pick_rendition(entry["png_path"], size)),
+    })
+    return out
+
+
+def _compressors() -> dict:
+    """Content-Encoding → compress function, in order of preference."""
+    compressors = {}
+    try:
+        import brotli
+    except ImportError:
+        pass
+    else:
+        compressors["br"] = lambda data: brotli.compress(data, quality=BROTLI_QUALITY)
+    compressors["gzip"] = lambda data: gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    return compressors
+
+
+COMPRESSORS = _compressors()
+
+
+class Payload:
+    """One serialized response, shared by every request for the same search."""
+
+    def __init__(self, data: dict, degraded: bool = False):
+        self.degraded = degraded  # built from a fallback expansion: clients must not cache it
+        self.body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+        # weak: the compressed variants are equivalent, not byte-identical
+        self.etag = f'W/"{hashlib.sha256(self.body).hexdigest()[:16]}"'
+        self._encoded: dict[str, bytes] = {}
+
+    def matches(self, if_none_match: str) -> bool:
+        """If-None-Match check, comparing weakly as RFC 9110 requires."""
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        return "*" in tags or self.etag.removeprefix("W/") in tags
+
+    def encoded(self, accept_encoding: str) -> tuple[bytes, str | None]:
+        """The body in the first encoding the client accepts, else as is."""
+        if len(self.body) < API_COMPRESS_MIN:
+            return self.body, None
+        accepted = {e.split(";")[0].strip() for e in accept_encoding.lower().split(",")}
+        for encoding, compress in COMPRESSORS.items():
+            if encoding in accepted:
+                if encoding not in self._encoded:
+                    self._encoded[encoding] = compress(self.body)
+                return self._encoded[encoding], encoding
+        return self.body, None
@@ -1,7 +1,16 @@
 """Pictogram search UI — phrase constructor."""
 
-import base64
-from collections import defaultdict
+import time
+
+_STARTED = time.perf_counter()  # before the heavy imports, so they count as a startup phase
+
+import asyncio
+import hmac
+import json
+import os
+import threading
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import gradio as gr
@@ -9,8 +18,27 @@ from dotenv import load_dotenv
 
 load_dotenv(Path(__file__).resolve().parent / ".env")
 
-from llm import expand_query
-from rag import retrieve, retrieve_phrase
+from api import API_IMAGE_SIZE, API_MAX_AGE, Payload, compact
+from bulk import (
+    AUDIENCES, BULK_CONCURRENCY, BULK_MAX_QUERIES, BULK_RATE, BULK_TOKEN, BULK_WORKERS, RateLimiter, read_jobs,
+    run as run_bulk,
+)
+from images import (
+    IMAGE_MODE, IMAGE_PRELOAD, IMAGE_URL_PREFIX, MEDIA_TYPES, image_cache, image_src, lookup, pick_encoding,
+    srcset,
+)
+from llm import (
+    LLM_TIMEOUT, cached_expansion_async, expand_query_async, expand_system, expansion_cache, fallback_expansion,
+    normalize_query,
+)
+from rag import (
+    embedding_cache, encode_texts, load_indexes, load_model, plan_embeddings, retrieve, retrieve_phrase,
+)
+
+# "eager" loads everything before binding; "background" binds first and reports not-ready
+# on /aacbot/ready until the loader finishes (searches before that load on first use)
+STARTUP_MODE = os.environ.get("STARTUP_MODE", "eager").lower()
+startup_phases: dict[str, float] = {"imports": round((time.perf_counter() - _STARTED) * 1000, 1)}
 
 PNG_DIR = Path(__file__).resolve().parent / "data" / "dyvogra-png"
 
@@ -78,14 +106,18 @@ EXAMPLES = {
 }
 
 
-def _img_b64(png_path: str) -> str | None:
-    try:
-        return base64.b64encode(Path(png_path).read_bytes()).decode()
-    except Exception:
-        return None
+def _img_tag(src: str, png_path: str, size: int, radius: int, shadow: str) -> str:
+    candidates = srcset(png_path, size)
+    srcset_attr = f' srcset="{candidates}"' if candidates else ""
+    return (
+        f'<img src="{src}"{srcset_attr} width="{size}" height="{size}" '
+        f'alt="" loading="lazy" decoding="async" '
+        f'style="display:block;width:{size}px;height:{size}px;object-fit:contain;background:#fff;'
+        f'border-radius:{radius}px;margin:0 auto;box-shadow:{shadow}">'
+    )
 
 
-def _render_constructor(parts: list[dict], language: str = "English") -> str:
+def _render_constructor(parts: list[dict], language: str = "English", image_mode: str = IMAGE_MODE) -> str:
     if not parts:
         return (
             '<p style="color:#4a5568;font-size:13px;padding:12px 0">'
@@ -97,17 +129,21 @@ def _render_constructor(parts: list[dict], language: str = "English") -> str:
         if i > 0:
             slots += '<span style="color:#a78bfa;font-size:24px;align-self:center;margin-top:14px">→</span>'
 
-        b64 = _img_b64(part["png_path"])
-        bg = f"url(data:image/png;base64,{b64}) center/contain no-repeat #fff" if b64 else "#1e2035"
+        src = image_src(part["png_path"], image_mode, size=96)
         role = part.get("role", "")
         name = part.get("display_name_uk", part["display_name"]) if language == "Українська" else part["display_name"]
+        if src and image_mode == "url":
+            icon = _img_tag(src, part["png_path"], 96, 12, "0 2px 12px rgba(0,0,0,0.4)")
+        else:
+            bg = f"url({src}) center/contain no-repeat #fff" if src else "#1e2035"
+            icon = (f'<div style="width:96px;height:96px;background:{bg};border-radius:12px;'
+                    f'box-shadow:0 2px 12px rgba(0,0,0,0.4)"></div>')
 
         slots += f"""
 <div style="flex:0 0 auto;text-align:center">
   <div style="font-size:10px;font-weight:700;color:#4a5568;text-transform:uppercase;
               letter-spacing:0.08em;margin-bottom:6px;height:14px">{role}</div>
-  <div style="width:96px;height:96px;background:{bg};border-radius:12px;
-              box-shadow:0 2px 12px rgba(0,0,0,0.4)"></div>
+  {icon}
   <div style="font-size:12px;font-weight:600;margin-top:8px;color:#e2e8f0;
               max-width:96px;line-height:1.3;word-wrap:break-word">{name}</div>
 </div>"""
@@ -120,7 +156,7 @@ def _render_constructor(parts: list[dict], language: str = "English") -> str:
     )
 
 
-def _render_results(results: list[dict], language: str) -> str:
+def _render_results(results: list[dict], language: str, image_mode: str = IMAGE_MODE) -> str:
     strings = UI_STRINGS.get(language, UI_STRINGS["English"])
     if not results:
         return f'<p style="color:#94a3b8;padding:24px 0">{strings["no_results"]}</p>'
@@ -165,17 +201,20 @@ def _render_results(results: list[dict], language: str) -> str:
         cat_label = (first.get("category_uk") or category) if use_uk else category.replace("_", " ").title()
         items_html = ""
         for r in symbols:
-            b64 = _img_b64(r["png_path"])
-            if not b64:
+            src = image_src(r["png_path"], image_mode, size=80)
+            if not src:
                 continue
-            src = f"data:image/png;base64,{b64}"
+            if image_mode == "url":
+                icon = _img_tag(src, r["png_path"], 80, 8, "0 1px 4px rgba(0,0,0,0.15)")
+            else:
+                icon = (f'<div style="width:80px;height:80px;background:url({src}) center/contain no-repeat #fff;'
+                        f'border-radius:8px;margin:0 auto;box-shadow:0 1px 4px rgba(0,0,0,0.15)"></div>')
             audience = strings.get(r.get("audience", ""), r.get("audience", ""))
             aud_color = "#4a90d9" if r.get("audience") == "children" else "#9b7fe8"
             label = r.get("display_name_uk", r["display_name"]) if language == "Українська" else r["display_name"]
             items_html += (
                 f'<div style="display:inline-block;text-align:center;width:100px;margin:6px;vertical-align:top">'
-                f'<div style="width:80px;height:80px;background:url({src}) center/contain no-repeat #fff;'
-                f'border-radius:8px;margin:0 auto;box-shadow:0 1px 4px rgba(0,0,0,0.15)"></div>'
+                f'{icon}'
                 f'<div style="font-size:12px;font-weight:600;margin-top:6px;line-height:1.3;color:#e2e8f0">{label}</div>'
                 f'<div style="font-size:10px;margin-top:2px;color:{aud_color};text-transform:uppercase;letter-spacing:0.06em">{audience}</div>'
                 f'</div>'
@@ -200,16 +239,211 @@ def _phrase_label(language: str) -> str:
     )
 
 
-def _search(query: str, language: str, audience_label: str):
-    if not query.strip():
-        return [], "", _render_constructor([]), ""
+def _render_skeleton(count: int, size: int) -> str:
+    """Grey placeholder tiles shown while a search is still running."""
+    tile = (
+        f'<div style="display:inline-block;width:{size}px;height:{size}px;margin:6px;'
+        f'background:#1e2035;border:1px solid #2d2f45;border-radius:10px;opacity:0.6"></div>'
+    )
+    return f'<div style="padding:12px 0">{tile * count}</div>'
+
+
+_PHRASE_SKELETON = _render_skeleton(3, 96)
+_RESULTS_SKELETON = _render_skeleton(8, 80)
+
+
+# CPU-bound work (encode, KNN, rendering) runs on a small pool sized to the cores;
+# the event loop itself only waits on the LLM, so many searches can be in flight at once
+CPU_WORKERS = int(os.environ.get("CPU_WORKERS", os.cpu_count() or 2))
+SEARCH_CONCURRENCY = int(os.environ.get("SEARCH_CONCURRENCY", 32))
+SEARCH_QUEUE_MAX = int(os.environ.get("SEARCH_QUEUE_MAX", 256))
+# retrieve on the raw query while the LLM expansion is in flight; served if the LLM fails
+SPECULATIVE_RETRIEVAL = os.environ.get("SPECULATIVE_RETRIEVAL", "1") == "1"
+
+_cpu_pool = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="search-cpu")
+
+
+def _phrase_step(expanded: str, phrase_parts_raw, audience: str | None):
+    # one batched encode for the keyword query, its halves and phrase fallbacks
+    embeddings = encode_texts(plan_embeddings(expanded, phrase_parts_raw))
+    return retrieve_phrase(phrase_parts_raw, audience, embeddings=embeddings), embeddings
+
+
+def _consume(future: asyncio.Future):
+    """Done-callback for futures nobody may await: retrieve the exception so it isn't logged."""
+    if not future.cancelled():
+        future.exception()
+
+
+async def _expand(query: str):
+    """(expansion, fell_back): expand_query_async bounded by LLM_TIMEOUT. On timeout or an API
+    error, llm.fallback_expansion (the local engine, or the raw input with LOCAL_FALLBACK=0).
+
+    The request is shielded so a late answer still lands in the caches."""
+    task = asyncio.ensure_future(expand_query_async(query, _cpu_pool, fallback=False))
+    task.add_done_callback(_consume)
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), LLM_TIMEOUT), False
+    except Exception:
+        expansion = await asyncio.get_running_loop().run_in_executor(_cpu_pool, fallback_expansion, query)
+        return expansion, True
+
+
+async def _search_once(query: str, language: str, audience_label: str, flight: "_Flight | None" = None):
+    """Streaming search: skeleton → speculative grid → phrase strip → grid, most relevant category first.
+
+    Each yield is (phrase_state, phrase_label, phrase_html, results_html). A fallback answer
+    marks `flight` degraded, which keeps it out of the render cache."""
+    query = query.strip()
     manual_audience = AUDIENCE_VALUE_MAP.get(audience_label)
-    expanded, phrase_parts_raw, detected_audience = expand_query(query.strip())
+    loop = asyncio.get_running_loop()
+
+    def run(fn, *args):
+        return loop.run_in_executor(_cpu_pool, fn, *args)
+
+    yield [], "", _PHRASE_SKELETON, _RESULTS_SKELETON
+
+    # a cached expansion is instant, so only speculate when the LLM will actually be called
+    speculative = None
+    if SPECULATIVE_RETRIEVAL and await cached_expansion_async(query, _cpu_pool) is None:
+        speculative = run(lambda: retrieve(query, n_results=40, audience=manual_audience))
+        speculative.add_done_callback(_consume)
+    expansion = asyncio.ensure_future(_expand(query))
+
+    spec_html = None
+    if speculative is not None:
+        await asyncio.wait({speculative, expansion}, return_when=asyncio.FIRST_COMPLETED)
+        if speculative.done():
+            spec_html = await run(_render_results, speculative.result(), language)
+            yield [], "", _PHRASE_SKELETON, spec_html
+
+    (expanded, phrase_parts_raw, detected_audience), fell_back = await expansion
+    if fell_back and flight is not None:
+        flight.degraded = True
     audience = manual_audience if manual_audience is not None else detected_audience
-    phrase = retrieve_phrase(phrase_parts_raw, audience)
-    results = retrieve(expanded, n_results=40, audience=audience)
+
+    # keywords echo the input (_parse_expansion discarded them): the speculative retrieval
+    # is exactly the keyword retrieval, so it becomes the grid
+    echoed = speculative is not None and expanded == query and audience == manual_audience
+    if speculative is not None and (fell_back or (echoed and not phrase_parts_raw)):
+        # the LLM failed or timed out (or echoed with no phrase): the raw-query result is the answer
+        if spec_html is None:
+            spec_html = await run(_render_results, await speculative, language)
+        yield [], "", _render_constructor([]), spec_html
+        return
+
+    phrase, embeddings = await run(_phrase_step, expanded, phrase_parts_raw, audience)
     label = _phrase_label(language) if phrase else ""
-    return phrase, label, _render_constructor(phrase, language), _render_results(results, language)
+    phrase_html = await run(_render_constructor, phrase, language)
+    yield phrase, label, phrase_html, spec_html or _RESULTS_SKELETON
+    if echoed:
+        if spec_html is None:
+            spec_html = await run(_render_results, await speculative, language)
+            yield phrase, label, phrase_html, spec_html
+        return
+
+    if speculative is not None:
+        speculative.cancel()  # superseded by the keyword retrieval; frees its pool slot if not started
+    results = await run(lambda: retrieve(expanded, n_results=40, audience=audience, embeddings=embeddings))
+    if results and spec_html is None:
+        # retrieve orders categories by relevance: show the best one before the full grid
+        first = [r for r in results if r["category"] == results[0]["category"]]
+        if len(first) < len(results):
+            yield phrase, label, phrase_html, await run(_render_results, first, language)
+    yield phrase, label, phrase_html, await run(_render_results, results, language)
+
+
+# finished searches are served from memory for a short while (bursts of the same example button)
+RENDER_CACHE_TTL = float(os.environ.get("RENDER_CACHE_TTL", 60))
+RENDER_CACHE_MAX = int(os.environ.get("RENDER_CACHE_MAX", 256))
+
+
+class _Flight:
+    """One running _search_once, shared by every caller with the same key.
+
+    Each update is a complete UI state, so a caller that joins late starts from the latest one."""
+
+    def __init__(self):
+        self.updates: list[tuple] = []
+        self.done = False
+        self.error: Exception | None = None
+        self.degraded = False  # a fallback answer: served to its followers, never cached
+        self._changed = asyncio.Condition()
+
+    async def run(self, updates):
+        try:
+            async for update in updates:
+                async with self._changed:
+                    self.updates.append(update)
+                    self._changed.notify_all()
+        except Exception as exc:
+            self.error = exc
+        finally:
+            async with self._changed:
+                self.done = True
+                self._changed.notify_all()
+
+    async def follow(self):
+        seen = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: len(self.updates) > seen or self.done)
+                count, done = len(self.updates), self.done
+            if count > seen:
+                seen = count
+                yield self.updates[count - 1]
+            if done and seen == len(self.updates):
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+_flights: dict[tuple, _Flight] = {}
+_rendered: OrderedDict[tuple, tuple[float, tuple]] = OrderedDict()
+search_stats = {"computed": 0, "coalesced": 0, "cache_hits": 0}
+
+
+def _finish(key: tuple, flight: _Flight):
+    _flights.pop(key, None)
+    if flight.error is None and flight.updates and not flight.degraded:
+        _rendered[key] = (time.monotonic() + RENDER_CACHE_TTL, flight.updates[-1])
+        _rendered.move_to_end(key)
+        while len(_rendered) > RENDER_CACHE_MAX:
+            _rendered.popitem(last=False)
+
+
+async def _single_flight(key: tuple, updates):
+    """Updates of the computation for `key`, started with `updates(flight)` unless one is running.
+
+    Identical concurrent searches follow one computation; its final state is then served
+    from memory for RENDER_CACHE_TTL seconds. The computation runs in its own task, so it
+    completes for the others even if the caller that started it disconnects."""
+    cached = _rendered.get(key)
+    if cached is not None and cached[0] > time.monotonic():
+        search_stats["cache_hits"] += 1
+        yield cached[1]
+        return
+
+    flight = _flights.get(key)
+    if flight is None:
+        search_stats["computed"] += 1
+        flight = _flights[key] = _Flight()
+        task = asyncio.ensure_future(flight.run(updates(flight)))
+        task.add_done_callback(lambda _: _finish(key, flight))
+    else:
+        search_stats["coalesced"] += 1
+    async for update in flight.follow():
+        yield update
+
+
+async def _search(query: str, language: str, audience_label: str):
+    """_search_once behind _single_flight, keyed on normalized (query, language, audience)."""
+    if not query.strip():
+        yield [], "", _render_constructor([]), ""
+        return
+    key = (normalize_query(query), language, AUDIENCE_VALUE_MAP.get(audience_label))
+    async for update in _single_flight(key, lambda flight: _search_once(query, language, audience_label, flight)):
+        yield update
 
 
 
@@ -296,11 +530,192 @@ with gr.Blocks(
     )
 
 
+# async handlers hold no thread while awaiting the LLM, so the limit can exceed the core count
+demo.queue(default_concurrency_limit=SEARCH_CONCURRENCY, max_size=SEARCH_QUEUE_MAX)
+
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 
 fastapi_app = FastAPI()
+
+
+@fastapi_app.get(IMAGE_URL_PREFIX + "/{digest}/{name}")
+def _serve_image(digest: str, name: str, request: Request):
+    """Content-addressed pictograms: the URL changes with the bytes, so cache forever."""
+    path = lookup(digest, name)
+    if path is None:
+        return Response(status_code=404)
+    etag = f'"{digest}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Vary": "Accept-Encoding",
+    }
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    body, encoding = pick_encoding(path, request.headers.get("accept-encoding", ""))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return FileResponse(body, media_type=MEDIA_TYPES[path.suffix], headers=headers)
+
+
+@fastapi_app.get("/aacbot/stats")
+def _stats():
+    """Cache counters for monitoring."""
+    return {"images": image_cache.stats(), "expansions": expansion_cache.stats(),
+            "embeddings": embedding_cache.stats(), "searches": dict(search_stats, rendered=len(_rendered))}
+
+
+# shared by all bulk requests, so parallel uploads don't multiply the LLM rate; bulk chunks get
+# their own small pool so an upload can't queue ahead of interactive searches on _cpu_pool
+_bulk_limiter = RateLimiter(BULK_RATE, BULK_CONCURRENCY)
+_bulk_pool = ThreadPoolExecutor(max_workers=BULK_WORKERS, thread_name_prefix="bulk-cpu")
+
+
+@fastapi_app.post("/aacbot/bulk")
+async def _bulk(request: Request):
+    """JSONL scenarios in the request body, NDJSON results streamed back chunk by chunk (see bulk.py).
+
+    Lines carry the job id, so a client can resubmit only the ids missing after a dropped connection.
+    Disabled (404) unless BULK_TOKEN is set; requests must carry it as a bearer token."""
+    if not BULK_TOKEN:
+        return Response(status_code=404)
+    sent = request.headers.get("authorization", "").encode()
+    if not hmac.compare_digest(sent, f"Bearer {BULK_TOKEN}".encode()):
+        return JSONResponse({"error": "bulk search needs a valid bearer token"}, status_code=401)
+    jobs = read_jobs((await request.body()).decode("utf-8", errors="replace").splitlines())
+    if len(jobs) > BULK_MAX_QUERIES:
+        return JSONResponse({"error": f"at most {BULK_MAX_QUERIES} queries per request"}, status_code=413)
+
+    async def lines():
+        async for results in run_bulk(jobs, limiter=_bulk_limiter, executor=_bulk_pool):
+            for result in results:
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+async def _api_search_once(query: str, audience: str | None, size: int, flight: "_Flight | None" = None):
+    """The UI pipeline without rendering: expansion, phrase, grid, as one compact Payload."""
+    loop = asyncio.get_running_loop()
+    (expanded, phrase_parts_raw, detected_audience), fell_back = await _expand(query)
+    if fell_back and flight is not None:
+        flight.degraded = True
+    audience = audience if audience is not None else detected_audience
+    phrase, embeddings = await loop.run_in_executor(_cpu_pool, _phrase_step, expanded, phrase_parts_raw, audience)
+    results = await loop.run_in_executor(
+        _cpu_pool, lambda: retrieve(expanded, n_results=40, audience=audience, embeddings=embeddings))
+    yield await loop.run_in_executor(_cpu_pool, lambda: Payload({
+        "query": query, "keywords": expanded, "audience": audience,
+        "phrase": [compact(p, size) for p in phrase],
+        "results": [compact(r, size) for r in results],
+    }, degraded=fell_back))
+
+
+@fastapi_app.get("/aacbot/api/search")
+async def _api_search(request: Request, q: str = "", audience: str | None = None, size: int = API_IMAGE_SIZE):
+    """Phrase and results as compact JSON with image URLs, for native clients (see api.py).
+
+    `audience` (children / adults) overrides the detected one; `size` picks the image rendition.
+    Responses carry a weak ETag (304 on If-None-Match) and are brotli/gzip compressed on request."""
+    query = q.strip()
+    if not query:
+        return JSONResponse({"error": "q is required"}, status_code=400)
+    if audience is not None and audience not in AUDIENCES:
+        return JSONResponse({"error": f"audience must be one of {', '.join(AUDIENCES)}"}, status_code=400)
+    key = ("api", normalize_query(query), audience, size)
+    async for payload in _single_flight(key, lambda flight: _api_search_once(query, audience, size, flight)):
+        pass
+
+    cache_control = "no-store" if payload.degraded else f"public, max-age={API_MAX_AGE}"
+    headers = {"ETag": payload.etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if payload.matches(request.headers.get("if-none-match", "")):
+        return Response(status_code=304, headers=headers)
+    body, encoding = payload.encoded(request.headers.get("accept-encoding", ""))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type="application/json", headers=headers)
+
+
+@fastapi_app.get("/aacbot/ready")
+def _ready_check():
+    """Readiness probe: 503 until the startup loader is done, with per-phase timings either way."""
+    body = {"ready": _ready.is_set(), "mode": STARTUP_MODE, "phases_ms": startup_phases}
+    if _startup_error:
+        body["error"] = _startup_error
+    return JSONResponse(body, status_code=200 if _ready.is_set() else 503)
+
+
+# routes registered above take precedence over the Gradio mount
 gr.mount_gradio_app(fastapi_app, demo, path="/aacbot")
+startup_phases["ui"] = round((time.perf_counter() - _STARTED) * 1000 - startup_phases["imports"], 1)
+
+_ready = threading.Event()
+_startup_error: str | None = None
+
+WARMUP_ON_START = os.environ.get("WARMUP_ON_START", "1") == "1"
+WARMUP_QUERIES = os.environ.get("WARMUP_QUERIES", "")  # extra JSONL/text query files, comma-separated
+
+
+def _warmup():
+    """Run EXAMPLES (both languages) and operator queries through every cache layer."""
+    from warmup import load_queries, report, warm
+
+    queries = [q for lang in EXAMPLES.values() for q in lang]
+    for path in filter(None, (p.strip() for p in WARMUP_QUERIES.split(","))):
+        queries += load_queries(path)
+    start = time.perf_counter()
+    by_stage, errors = warm(
+        queries,
+        render=lambda phrase, results: (_render_constructor(phrase), _render_results(results, _DEFAULT_LANG)),
+    )
+    report(by_stage, time.perf_counter() - start, errors)
+
+
+def _timed(phase: str, fn):
+    start = time.perf_counter()
+    fn()
+    startup_phases[phase] = round((time.perf_counter() - start) * 1000, 1)
+
+
+def _load():
+    """Everything the first search would otherwise pay for, one timed phase at a time."""
+    global _startup_error
+    try:
+        if IMAGE_PRELOAD and IMAGE_MODE == "inline":
+            _timed("images", image_cache.preload)
+        _timed("catalog", expand_system)
+        _timed("model", load_model)
+        _timed("index", load_indexes)
+    except Exception as exc:
+        _startup_error = f"{type(exc).__name__}: {exc}"
+        raise
+
+
+def _warm_and_ready():
+    """The warm-up phase (after bind in either mode), then readiness.
+
+    Searches work meanwhile; /aacbot/ready stays 503 so the orchestrator waits for warm caches.
+    A failed warm-up is logged, not fatal: the caches simply fill on demand."""
+    if WARMUP_ON_START:
+        try:
+            _timed("warmup", _warmup)
+        except Exception as exc:
+            print(f"Warm-up failed: {type(exc).__name__}: {exc}")
+    _ready.set()
+    print("Startup phases (ms): " + ", ".join(f"{k} {v:.0f}" for k, v in startup_phases.items()))
+
+
+def _startup():
+    _load()
+    _warm_and_ready()
+
 
 if __name__ == "__main__":
+    if STARTUP_MODE == "background":
+        threading.Thread(target=_startup, name="startup-loader", daemon=True).start()
+    else:
+        _load()
+        threading.Thread(target=_warm_and_ready, name="startup-warmup", daemon=True).start()
     uvicorn.run(fastapi_app, host="0.0.0.0", port=7860, proxy_headers=True, forwarded_allow_ips="*")
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks for the search hot path. Run against a populated pictograms.db."""
+
+import argparse
+import statistics
+import time
+
+SAMPLE_KEYWORDS = [
+    "ill, sick, do not want, eat, sad, tired, doctor man",
+    "hungry, eat, want, food, soup",
+    "toilet, want, wash hands",
+    "yes, thank you",
+]
+SAMPLE_PHRASE = (("subject", "I"), ("want", "want"), ("object", "eat"), ("person", "mother"))
+PARITY_QUERIES = SAMPLE_KEYWORDS + [
+    "child is sick and doesn't want to eat", "I am scared and want my mother",
+    "дитина хвора і не хоче їсти", "хочу в туалет", "hard to breathe", "thank you",
+]
+PARITY_TOLERANCE = 0.03  # max shift of any query↔symbol distance vs torch; thresholds are 1.12/1.20
+
+
+def _timeit(fn, iterations: int) -> list[float]:
+    fn()  # warm-up: model, page cache, statement cache
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _report(label: str, samples: list[float]) -> float:
+    median = statistics.median(samples)
+    p95 = sorted(samples)[int(len(samples) * 0.95) - 1]
+    print(f"  {label:<28} median {median:7.2f} ms   p95 {p95:7.2f} ms")
+    return median
+
+
+def bench_pool(iterations: int):
+    """Per-search latency with a fresh connection per query vs pooled warm connections."""
+    import rag
+
+    def search():
+        for keywords in SAMPLE_KEYWORDS:
+            rag.retrieve(keywords)
+        rag.retrieve_phrase(SAMPLE_PHRASE)
+
+    pooled_db = rag._db
+    print(f"Searches: {len(SAMPLE_KEYWORDS)} retrieve + 1 retrieve_phrase, {iterations} iterations")
+    try:
+        rag._db = rag._open_db  # old behaviour: connect + load extension on every call
+        fresh = _report("fresh connection per query", _timeit(search, iterations))
+    finally:
+        rag._db = pooled_db
+    pooled = _report("pooled connection", _timeit(search, iterations))
+    per_search = (fresh - pooled) / (len(SAMPLE_KEYWORDS) + 1)
+    print(f"  saved {per_search:.2f} ms per search ({(1 - pooled / fresh) * 100:.0f}%)")
+
+
+def _synthetic_db(n: int, dim: int, cluster_size: int = 0):
+    """In-memory symbols + symbol_vss with n random unit vectors.
+
+    With `cluster_size`, vectors scatter around n / cluster_size random centroids, closer to how
+    sentence embeddings of related symbol names group than uniform noise is."""
+    import numpy as np
+
+    rng = np.random.default_rng(n)
+    if cluster_size:
+        centroids = rng.standard_normal((max(n // cluster_size, 1), dim))
+        centroids /= np.linalg.norm(centroids, axis=1, keepdims=True)
+        matrix = centroids[rng.integers(0, len(centroids), n)] + rng.normal(0, 1.2 / np.sqrt(dim), (n, dim))
+    else:
+        matrix = rng.standard_normal((n, dim))
+    matrix = (matrix / np.linalg.norm(matrix, axis=1, keepdims=True)).astype(np.float32)
+    return _vector_db(matrix), rng
+
+
+def _vector_db(matrix):
+    """In-memory symbols + symbol_vss holding the rows of `matrix`."""
+    import sqlite3
+
+    import sqlite_vec
+
+    n, dim = matrix.shape
+    conn = sqlite3.connect(":memory:")
+    conn.enable_load_extension(True)
+    sqlite_vec.load(conn)
+    conn.enable_load_extension(False)
+    conn.execute("CREATE TABLE symbols (symbol_id TEXT PRIMARY KEY, display_name TEXT, category TEXT, "
+                 "audience TEXT, png_path TEXT, display_name_uk TEXT, category_uk TEXT)")
+    conn.execute(f"CREATE VIRTUAL TABLE symbol_vss USING vec0(symbol_id TEXT PRIMARY KEY, embedding FLOAT[{dim}])")
+    conn.executemany("INSERT INTO symbols VALUES (?, ?, 'cat', 'children', 'x.png', NULL, NULL)",
+                     [(f"s{i}", f"name {i}") for i in range(n)])
+    conn.executemany("INSERT INTO symbol_vss VALUES (?, ?)",
+                     [(f"s{i}", vec.tobytes()) for i, vec in enumerate(matrix)])
+    conn.commit()
+    return conn
+
+
+def bench_knn(iterations: int):
+    """sqlite-vec MATCH vs in-memory MatrixIndex at several corpus sizes (3 queries per search)."""
+    import numpy as np
+
+    import rag
+
+    for n in (200, 10_000, 100_000):
+        conn, rng = _synthetic_db(n, rag.EMBED_DIM)
+        queries = rng.standard_normal((3, rag.EMBED_DIM)).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        load_start = time.perf_counter()
+        index = rag.MatrixIndex.load(conn)
+        print(f"{n} symbols (index load {(time.perf_counter() - load_start) * 1000:.0f} ms, "
+              f"{index.matrix.nbytes / 1e6:.1f} MB)")
+
+        def sqlite_search():
+            for q in queries:
+                conn.execute(rag._KNN_SQL, (q.tobytes(), 40)).fetchall()
+
+        _report("sqlite-vec", _timeit(sqlite_search, iterations))
+        _report("numpy, one query at a time", _timeit(lambda: [index.search(q, 40) for q in queries], iterations))
+        _report("numpy, batched", _timeit(lambda: index.search(queries, 40), iterations))
+        conn.close()
+
+
+def _real_vectors():
+    """symbol_vss of pictograms.db as a float32 matrix, or None without a built DB."""
+    import sqlite3
+
+    import numpy as np
+    import sqlite_vec
+
+    import rag
+
+    if not rag.DB_PATH.is_file():
+        return None
+    conn = sqlite3.connect(f"{rag.DB_PATH.as_uri()}?mode=ro", uri=True)
+    try:
+        conn.enable_load_extension(True)
+        sqlite_vec.load(conn)
+        blobs = [r[0] for r in conn.execute("SELECT embedding FROM symbol_vss")]
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+    return np.frombuffer(b"".join(blobs), dtype=np.float32).reshape(len(blobs), rag.EMBED_DIM) if blobs else None
+
+
+QUANT_MAX_K = 4096  # sqlite-vec's cap on a KNN query's k
+
+
+def bench_quant(iterations: int, k: int = 40, n_queries: int = 50):
+    """recall@k and latency of the binary symbol_vss_q index against exact sqlite-vec KNN.
+
+    Runs on the real symbol vectors when pictograms.db is built, and on synthetic libraries:
+    clustered (closer to real embeddings) and uniform random (the worst case for sign bits).
+    Each is measured at QUANT_OVERSAMPLE and at 4× it, to show what more candidates buy."""
+    import numpy as np
+
+    import rag
+    from ingest import QUANT_COLUMNS, QUANT_FUNCS
+
+    libraries = []
+    real = _real_vectors()
+    if real is not None:
+        libraries.append(("real", lambda: (_vector_db(real), np.random.default_rng(0))))
+    for n in (200, 10_000, 100_000):
+        libraries.append((f"clustered {n}", lambda n=n: _synthetic_db(n, rag.EMBED_DIM, cluster_size=50)))
+        libraries.append((f"random {n}", lambda n=n: _synthetic_db(n, rag.EMBED_DIM)))
+
+    for label, build in libraries:
+        conn, rng = build()
+        matrix = np.frombuffer(
+            b"".join(r[0] for r in conn.execute("SELECT embedding FROM symbol_vss")), dtype=np.float32,
+        ).reshape(-1, rag.EMBED_DIM)
+        n = len(matrix)
+        # queries near existing symbols, like a paraphrase of a symbol name
+        queries = matrix[rng.integers(0, n, n_queries)] + rng.normal(0, 0.03, (n_queries, rag.EMBED_DIM))
+        queries = (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+        exact = [{r[0] for r in conn.execute(rag._KNN_SQL, (q.tobytes(), k))} for q in queries]
+
+        print(f"{label} ({n} symbols), recall@{k} over {n_queries} queries")
+        _report("exact float32", _timeit(lambda: conn.execute(rag._KNN_SQL, (queries[0].tobytes(), k)).fetchall(),
+                                         iterations))
+        conn.execute(f"CREATE VIRTUAL TABLE symbol_vss_q USING vec0(symbol_id TEXT PRIMARY KEY, "
+                     f"embedding {QUANT_COLUMNS['binary']})")
+        conn.execute(f"INSERT INTO symbol_vss_q SELECT symbol_id, {QUANT_FUNCS['binary']} FROM symbol_vss")
+        sql = rag._QUANT_SQL.format(quantize=rag._QUANTIZE_EXPR["bit["])
+        for oversample in (rag.QUANT_OVERSAMPLE, rag.QUANT_OVERSAMPLE * 4):
+            candidates = min(k * oversample, n, QUANT_MAX_K)
+
+            def search(q):
+                return conn.execute(sql, (q.tobytes(), candidates, q.tobytes(), k)).fetchall()
+
+            recall = statistics.mean(len({r[0] for r in search(q)} & ex) / len(ex)
+                                     for q, ex in zip(queries, exact) if ex)
+            _report(f"binary ×{oversample} + re-rank", _timeit(lambda: search(queries[0]), iterations))
+            print(f"  {'':<28} recall@{k} {recall:.3f}")
+        conn.close()
+
+
+def _symbol_names(limit: int = 500) -> list[str]:
+    import sqlite3
+
+    import rag
+
+    try:
+        conn = sqlite3.connect(f"file:{rag.DB_PATH}?mode=ro", uri=True)
+        try:
+            return [r[0] for r in conn.execute(
+                "SELECT DISTINCT display_name FROM symbols ORDER BY display_name LIMIT ?", (limit,))]
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return []
+
+
+def _profile_encoder(backend: str, texts: list[str], iterations: int) -> dict:
+    """Runs in a fresh process so peak RSS covers only this backend's imports and model."""
+    import resource
+
+    import encoders
+    import rag
+
+    start = time.perf_counter()
+    encoder = encoders.load_encoder(rag.EMBED_MODEL, backend)
+    load_ms = (time.perf_counter() - start) * 1000
+    vectors = encoder.encode(texts, normalize_embeddings=True)
+    return {
+        "load_ms": load_ms,
+        "single": _timeit(lambda: encoder.encode(texts[:1], normalize_embeddings=True), iterations),
+        "batch": _timeit(lambda: encoder.encode(texts[:8], normalize_embeddings=True), iterations),
+        "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "vectors": [list(map(float, v)) for v in vectors],
+        "shapes": None if backend == "torch" else (encoder.encode(texts[0]).shape, encoder.encode([]).shape),
+    }
+
+
+def bench_encode(iterations: int, backends=("torch", "onnx", "onnx-int8")):
+    """Latency, peak RSS and distance parity of each EMBED_BACKEND against torch.
+
+    Parity compares every query↔symbol distance; exits non-zero past PARITY_TOLERANCE or when
+    an ONNX encoder returns the wrong shape for a bare str or an empty list. Backends whose
+    model is missing are skipped, and parity is skipped without the torch reference."""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    import numpy as np
+
+    import rag
+
+    symbols = _symbol_names() or PARITY_QUERIES
+    texts = PARITY_QUERIES + symbols
+    ctx = multiprocessing.get_context("spawn")
+    profiles = {}
+    for backend in backends:
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            try:
+                profiles[backend] = pool.submit(_profile_encoder, backend, texts, iterations).result()
+            except Exception as exc:
+                print(f"{backend}: skipped ({exc})")
+                continue
+        p = profiles[backend]
+        print(f"{backend} (load {p['load_ms']:.0f} ms, peak RSS {p['rss_mb']:.0f} MB)")
+        _report("1 query", p["single"])
+        _report("batch of 8", p["batch"])
+
+    def distances(vectors):
+        v = np.asarray(vectors, dtype=np.float32)
+        q, s = v[:len(PARITY_QUERIES)], v[len(PARITY_QUERIES):]
+        return np.sqrt(np.clip(2 - 2 * q @ s.T, 0, None))
+
+    failed = False
+    for backend, p in profiles.items():
+        expected = ((rag.EMBED_DIM,), (0, rag.EMBED_DIM))
+        if backend != "torch" and tuple(p["shapes"]) != expected:
+            print(f"  {backend:<12} shapes {p['shapes']} for str / [], expected {expected}   FAIL")
+            failed = True
+
+    if "torch" not in profiles:
+        print("Parity vs torch: skipped, torch backend unavailable")
+        if failed:
+            raise SystemExit(1)
+        return
+    reference = distances(profiles["torch"]["vectors"])
+    print(f"Parity vs torch over {reference.size} query↔symbol distances (tolerance {PARITY_TOLERANCE})")
+    for backend, p in profiles.items():
+        if backend == "torch":
+            continue
+        d = distances(p["vectors"])
+        delta = np.abs(d - reference)
+        flips = int(((d <= rag.SYMBOL_THRESHOLD) != (reference <= rag.SYMBOL_THRESHOLD)).sum())
+        ok = delta.max() <= PARITY_TOLERANCE
+        failed |= not ok
+        print(f"  {backend:<12} max Δ {delta.max():.4f}   mean Δ {delta.mean():.4f}   "
+              f"threshold flips {flips}   {'OK' if ok else 'FAIL'}")
+    if failed:
+        raise SystemExit(1)
+
+
+class _StubAnthropic:
+    """Stands in for anthropic.Anthropic in bench_expand: estimates input tokens (~4 chars each)
+    and sleeps for a modeled time-to-first-token. A system block carrying cache_control whose
+    text was sent before counts as a prompt-cache read, like the provider's ephemeral cache."""
+
+    BASE_MS = 150.0        # network + first decoding step
+    MS_PER_1K_INPUT = 40.0  # prefill of uncached input
+    MS_PER_1K_CACHED = 4.0  # cache reads are roughly an order of magnitude cheaper
+
+    def __init__(self):
+        self.messages = self
+        self.usage: list[dict] = []
+        self._cached: set[str] = set()
+
+    def create(self, system, messages, **_):
+        uncached = cached = 0
+        for block in system:
+            tokens = len(block["text"]) // 4
+            if "cache_control" in block and block["text"] in self._cached:
+                cached += tokens
+            else:
+                uncached += tokens
+                if "cache_control" in block:
+                    self._cached.add(block["text"])
+        uncached += sum(len(m["content"]) // 4 for m in messages)
+        self.usage.append({"input_tokens": uncached, "cache_read_input_tokens": cached})
+        time.sleep((self.BASE_MS + uncached * self.MS_PER_1K_INPUT / 1000
+                    + cached * self.MS_PER_1K_CACHED / 1000) / 1000)
+        text = '{"keywords": "eat, want", "phrase_parts": [], "audience": "any"}'
+        return type("Message", (), {"content": [type("Block", (), {"text": text})()]})()
+
+
+def bench_expand(iterations: int):
+    """Time to first token and input tokens per uncached expand_query, per prompt mode (stub client)."""
+    import tempfile
+
+    import llm
+    from cache import PersistentCache
+
+    modes = {"full, no prompt cache": ("full", False), "full + prompt cache": ("full", True),
+             "slim catalog": ("slim", False)}
+    saved = llm.EXPAND_CATALOG, llm.PROMPT_CACHE, llm._get_client, llm.expansion_cache
+    print(f"Full catalog ≈{len(llm.expand_system()) // 4} tokens; {iterations} distinct queries per mode")
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            llm.expansion_cache = PersistentCache(f"{tmp}/expansions.db", "expansions", ttl=3600, max_entries=100)
+            for label, (catalog, prompt_cache) in modes.items():
+                llm.EXPAND_CATALOG, llm.PROMPT_CACHE = catalog, prompt_cache
+                llm._prompt_hash.cache_clear()
+                stub = _StubAnthropic()
+                llm._get_client = lambda: stub
+                samples = []
+                for i in range(iterations):
+                    # distinct per mode and iteration: never an expansion-cache hit
+                    query = f"{SAMPLE_KEYWORDS[i % len(SAMPLE_KEYWORDS)]} #{label} {i}"
+                    start = time.perf_counter()
+                    llm.expand_query(query)
+                    samples.append((time.perf_counter() - start) * 1000)
+                _report(label, samples)
+                print(f"  {'':<28} input ≈{statistics.mean(u['input_tokens'] for u in stub.usage):7.0f} tok   "
+                      f"cache read ≈{statistics.mean(u['cache_read_input_tokens'] for u in stub.usage):7.0f} tok")
+    finally:
+        llm.EXPAND_CATALOG, llm.PROMPT_CACHE, llm._get_client, llm.expansion_cache = saved
+        llm._prompt_hash.cache_clear()
+
+
+BENCHES = {"pool": bench_pool, "knn": bench_knn, "quant": bench_quant, "encode": bench_encode,
+           "expand": bench_expand}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search hot-path micro-benchmarks")
+    parser.add_argument("bench", choices=list(BENCHES), help="Benchmark to run")
+    parser.add_argument("-n", "--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    BENCHES[args.bench](args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""Bulk search for offline board generation: JSONL scenarios in, one JSON result per line out.
+
+LLM expansions run concurrently under a rate limit; every keyword string and phrase fallback
+of a chunk is encoded in one batch and searched with one MatrixIndex product. Results are
+appended per chunk, so an interrupted run resumes where it stopped:
+
+    python bulk.py scenarios.jsonl -o boards.jsonl
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+
+from llm import cached_expansion_async, expand_query_async
+from rag import batch_neighbors, encode_texts, plan_embeddings, retrieve, retrieve_phrase
+from warmup import QUERY_FIELDS
+
+BULK_CHUNK = int(os.environ.get("BULK_CHUNK", 64))               # jobs per encode/KNN batch
+BULK_CONCURRENCY = int(os.environ.get("BULK_CONCURRENCY", 8))    # LLM calls in flight
+BULK_RATE = float(os.environ.get("BULK_RATE", 4))                # LLM calls started per second (0 = no limit)
+BULK_MAX_QUERIES = int(os.environ.get("BULK_MAX_QUERIES", 5000))  # per HTTP request
+# POST /aacbot/bulk is off unless a token is set; clients send "Authorization: Bearer <token>"
+BULK_TOKEN = os.environ.get("BULK_TOKEN", "")
+BULK_WORKERS = int(os.environ.get("BULK_WORKERS", 1))            # encode/KNN threads for HTTP bulk jobs
+ID_FIELDS = ("id", "request_id")
+AUDIENCES = ("children", "adults")
+
+
+def read_jobs(lines) -> list[dict]:
+    """{"id", "query", "audience"} per JSONL object; plain-text lines are queries too.
+
+    The id is the first of ID_FIELDS, else "#<line number>"; the query the first of QUERY_FIELDS.
+    An "audience" field ("children" / "adults") overrides the one the expansion detects."""
+    jobs = []
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            obj = json.loads(line)
+        except json.JSONDecodeError:
+            obj = line
+        if isinstance(obj, str):
+            obj = {"query": obj}
+        if not isinstance(obj, dict):
+            continue
+        query = next((obj[f] for f in QUERY_FIELDS if isinstance(obj.get(f), str) and obj[f].strip()), "")
+        if not query:
+            continue
+        jobs.append({
+            "id": str(next((obj[f] for f in ID_FIELDS if obj.get(f) is not None), f"#{number}")),
+            "query": query.strip(),
+            "audience": obj.get("audience") if obj.get("audience") in AUDIENCES else None,
+        })
+    return jobs
+
+
+class RateLimiter:
+    """At most `concurrency` calls in flight, started no faster than `rate` per second."""
+
+    def __init__(self, rate: float, concurrency: int):
+        self._interval = 1 / rate if rate > 0 else 0.0
+        self._slots = asyncio.Semaphore(concurrency)
+        self._lock = asyncio.Lock()
+        self._next = 0.0
+
+    async def __aenter__(self):
+        await self._slots.acquire()
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            wait = self._next - now
+            self._next = max(now, self._next) + self._interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def __aexit__(self, *exc):
+        self._slots.release()
+
+
+async def expand_all(queries: list[str], limiter: RateLimiter, executor=None) -> list:
+    """Expansions for every query; cached ones skip the limiter."""
+    async def one(query: str):
+        cached = await cached_expansion_async(query, executor)
+        if cached is not None:
+            return cached
+        async with limiter:
+            return await expand_query_async(query, executor)
+
+    return await asyncio.gather(*(one(q) for q in queries))
+
+
+def _symbol(entry: dict) -> dict:
+    """A retrieve/retrieve_phrase entry without the server-specific absolute path."""
+    return dict(entry, png_path=Path(entry["png_path"]).name)
+
+
+def search_chunk(jobs: list[dict], expansions: list) -> list[dict]:
+    """Phrase and grid for each job: one encode batch and one KNN product for the whole chunk."""
+    plans = [(keywords, parts, job["audience"] or audience)
+             for job, (keywords, parts, audience) in zip(jobs, expansions)]
+    texts = [t for keywords, parts, _ in plans for t in plan_embeddings(keywords, parts)]
+    embeddings = encode_texts(texts)
+    neighbors = batch_neighbors(texts, embeddings, 40)
+
+    out = []
+    for job, (keywords, parts, audience) in zip(jobs, plans):
+        phrase = retrieve_phrase(parts, audience, embeddings=embeddings, neighbors=neighbors)
+        results = retrieve(keywords, n_results=40, audience=audience, embeddings=embeddings, neighbors=neighbors)
+        out.append({
+            "id": job["id"], "query": job["query"], "keywords": keywords, "audience": audience,
+            "phrase_parts": [{"role": role, "symbol": symbol} for role, symbol in parts],
+            "phrase": [_symbol(p) for p in phrase],
+            "results": [_symbol(r) for r in results],
+        })
+    return out
+
+
+async def run(jobs: list[dict], chunk: int = BULK_CHUNK, limiter: RateLimiter | None = None, executor=None):
+    """Yield result lists chunk by chunk. The next chunk's expansions overlap this chunk's search."""
+    limiter = limiter or RateLimiter(BULK_RATE, BULK_CONCURRENCY)
+    loop = asyncio.get_running_loop()
+    chunks = [jobs[i:i + chunk] for i in range(0, len(jobs), chunk)]
+    pending = asyncio.ensure_future(expand_all([j["query"] for j in chunks[0]], limiter, executor)) if chunks else None
+    for i, part in enumerate(chunks):
+        expansions = await pending
+        if i + 1 < len(chunks):
+            pending = asyncio.ensure_future(expand_all([j["query"] for j in chunks[i + 1]], limiter, executor))
+        yield await loop.run_in_executor(executor, search_chunk, part, expansions)
+
+
+def done_ids(path: Path) -> set[str]:
+    """Ids already written to an output file (a torn last line from a crash is ignored)."""
+    if not path.exists():
+        return set()
+    ids = set()
+    for line in path.read_text(encoding="utf-8").splitlines():
+        try:
+            ids.add(str(json.loads(line)["id"]))
+        except (json.JSONDecodeError, KeyError, TypeError):
+            pass
+    return ids
+
+
+def main():
+    from tqdm import tqdm
+
+    parser = argparse.ArgumentParser(description="Bulk pictogram search over a JSONL file of scenarios")
+    parser.add_argument("input", type=Path, help="JSONL (or plain text) with one query per line")
+    parser.add_argument("-o", "--output", type=Path, required=True, help="JSONL results; resumed if it exists")
+    parser.add_argument("--chunk", type=int, default=BULK_CHUNK)
+    parser.add_argument("--concurrency", type=int, default=BULK_CONCURRENCY)
+    parser.add_argument("--rate", type=float, default=BULK_RATE, help="LLM calls per second, 0 = unlimited")
+    args = parser.parse_args()
+
+    jobs = read_jobs(args.input.read_text(encoding="utf-8").splitlines())
+    done = done_ids(args.output)
+    todo = [j for j in jobs if j["id"] not in done]
+    print(f"{len(jobs)} jobs, {len(jobs) - len(todo)} already in {args.output}, {len(todo)} to run")
+
+    if args.output.exists() and args.output.read_bytes()[-1:] not in (b"", b"\n"):
+        with open(args.output, "a", encoding="utf-8") as out:
+            out.write("\n")  # a run killed mid-line: keep the torn line separate
+
+    async def go():
+        start = time.perf_counter()
+        limiter = RateLimiter(args.rate, args.concurrency)
+        with open(args.output, "a", encoding="utf-8") as out, tqdm(total=len(todo), unit="query") as bar:
+            async for results in run(todo, args.chunk, limiter):
+                out.writelines(json.dumps(r, ensure_ascii=False) + "\n" for r in results)
+                out.flush()
+                bar.update(len(results))
+        print(f"Done in {time.perf_counter() - start:.1f} s")
+
+    asyncio.run(go())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Small persistent key/value cache on SQLite, shared by every worker process on the host."""
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+EVICT_EVERY = 64  # writes between TTL/size sweeps
+
+
+class PersistentCache:
+    """JSON values in one SQLite table with a TTL and a max entry count.
+
+    WAL mode lets several processes read while one writes; each thread keeps its own
+    connection. Eviction drops expired rows first, then the oldest beyond `max_entries`."""
+
+    def __init__(self, path: str | Path, table: str, ttl: float, max_entries: int):
+        self.path = Path(path)
+        self.table = table
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()  # guards the counters; connections are per thread
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_created ON {self.table}(created_at)")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        """Return the cached value, or None when missing, expired or the cache is unusable."""
+        try:
+            row = self._conn().execute(
+                f"SELECT value FROM {self.table} WHERE key = ? AND created_at > ?",
+                (key, time.time() - self.ttl),
+            ).fetchone()
+        except sqlite3.Error:
+            row = None
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return None if row is None else json.loads(row[0])
+
+    def set(self, key: str, value) -> None:
+        self.set_many({key: value})
+
+    def set_many(self, items: dict) -> None:
+        """Write every key → value in one transaction (one commit and fsync for the batch)."""
+        if not items:
+            return
+        now = time.time()
+        rows = [(key, json.dumps(value, ensure_ascii=False), now) for key, value in items.items()]
+        try:
+            conn = self._conn()
+            with conn:
+                conn.executemany(f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?)", rows)
+            with self._lock:
+                sweep = self._writes // EVICT_EVERY != (self._writes + len(rows)) // EVICT_EVERY
+                self._writes += len(rows)
+            if sweep:
+                self.evict()
+        except sqlite3.Error:
+            pass  # a cache write failing must never fail the request
+
+    def evict(self) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute(f"DELETE FROM {self.table} WHERE created_at <= ?", (time.time() - self.ttl,))
+            conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} "
+                f"ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        try:
+            entries = self._conn().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+        return {"entries": entries, "hits": hits, "misses": misses,
+                "hit_rate": round(hits / total, 4) if total else 0.0}
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Sentence encoders for rag and ingest: PyTorch SentenceTransformer or an ONNX Runtime export.
+
+Both expose `encode(texts, normalize_embeddings=True) → float32 array`. The ONNX backend does
+tokenization (`tokenizers`) and mean pooling in NumPy, so serving needs neither torch nor
+sentence-transformers. `python encoders.py export` writes the model to ONNX_MODEL_DIR."""
+
+import argparse
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# "torch" (SentenceTransformer), "onnx" (fp32 export) or "onnx-int8" (dynamically quantized export)
+EMBED_BACKEND = os.environ.get("EMBED_BACKEND", "torch").lower()
+ONNX_MODEL_DIR = Path(os.environ.get("ONNX_MODEL_DIR", BASE_DIR / "models" / "minilm-onnx"))
+ONNX_THREADS = int(os.environ.get("ONNX_THREADS", 0))  # 0 lets ONNX Runtime pick
+ONNX_FILES = {"onnx": "model.onnx", "onnx-int8": "model_int8.onnx"}
+BATCH_SIZE = 64
+
+
+class OnnxEncoder:
+    """SentenceTransformer-compatible encoder over an exported transformer (mean pooling)."""
+
+    def __init__(self, model_dir: Path, file: str):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        config = json.loads((model_dir / "encoder.json").read_text())
+        self.model_name = config["model"]
+        self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=config["pad_id"], pad_token=config["pad_token"])
+        options = ort.SessionOptions()
+        if ONNX_THREADS:
+            options.intra_op_num_threads = ONNX_THREADS
+        self.session = ort.InferenceSession(str(model_dir / file), options, providers=["CPUExecutionProvider"])
+        self.dim = self.session.get_outputs()[0].shape[-1]  # hidden size; only batch and tokens are dynamic
+
+    def encode(self, texts, normalize_embeddings: bool = True, batch_size: int = BATCH_SIZE) -> np.ndarray:
+        """(len(texts), dim) float32; a bare str gives one (dim,) vector, as SentenceTransformer does."""
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        if not texts:
+            return np.empty((0, self.dim), dtype=np.float32)
+        batches = []
+        for i in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch(texts[i:i + batch_size])
+            ids = np.array([e.ids for e in encodings], dtype=np.int64)
+            mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            hidden = self.session.run(None, {"input_ids": ids, "attention_mask": mask})[0]
+            weights = mask[..., None].astype(np.float32)
+            batches.append((hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None))
+        vectors = np.concatenate(batches).astype(np.float32)
+        if normalize_embeddings:
+            vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors[0] if single else vectors
+
+
+def load_encoder(model_name: str, backend: str | None = None):
+    """The encoder for `backend` (default EMBED_BACKEND); the ONNX export must match `model_name`."""
+    backend = backend or EMBED_BACKEND
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+
+        return SentenceTransformer(model_name)
+    if backend not in ONNX_FILES:
+        raise ValueError(f"Unknown EMBED_BACKEND {backend!r}: use torch, {' or '.join(ONNX_FILES)}")
+    if not (ONNX_MODEL_DIR / ONNX_FILES[backend]).is_file():
+        raise RuntimeError(f"EMBED_BACKEND={backend} needs {ONNX_MODEL_DIR / ONNX_FILES[backend]}: "
+                           "run python encoders.py export")
+    encoder = OnnxEncoder(ONNX_MODEL_DIR, ONNX_FILES[backend])
+    if encoder.model_name != model_name:
+        raise RuntimeError(f"{ONNX_MODEL_DIR} holds {encoder.model_name}, expected {model_name}")
+    return encoder
+
+
+def export(model_name: str, out_dir: Path, quantize: bool = True):
+    """Export the transformer to ONNX (plus an int8 copy) with its tokenizer. Needs torch."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer, pooling = st[0], st[1]
+    if not pooling.pooling_mode_mean_tokens:
+        raise RuntimeError(f"{model_name} does not use mean pooling; OnnxEncoder would not match it")
+    tokenizer = transformer.tokenizer
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tokenizer.save_pretrained(out_dir)  # tokenizer.json for the fast tokenizer
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    axes = {0: "batch", 1: "tokens"}
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer.auto_model.eval(),
+            (sample["input_ids"], sample["attention_mask"]),
+            str(out_dir / ONNX_FILES["onnx"]),
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={"input_ids": axes, "attention_mask": axes, "last_hidden_state": axes},
+            opset_version=17,
+        )
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(out_dir / ONNX_FILES["onnx"], out_dir / ONNX_FILES["onnx-int8"],
+                         weight_type=QuantType.QInt8)
+    (out_dir / "encoder.json").write_text(json.dumps({
+        "model": model_name, "max_seq_length": st.max_seq_length,
+        "pad_id": tokenizer.pad_token_id, "pad_token": tokenizer.pad_token,
+    }, indent=2))
+    for path in sorted(out_dir.glob("*.onnx")):
+        print(f"  {path.name:<20} {path.stat().st_size / 1e6:7.1f} MB")
+
+
+def main():
+    from rag import EMBED_MODEL
+
+    parser = argparse.ArgumentParser(description="Encoder backend maintenance")
+    parser.add_argument("command", choices=["export"])
+    parser.add_argument("--out", type=Path, default=ONNX_MODEL_DIR)
+    parser.add_argument("--no-quantize", action="store_true", help="Skip the int8 copy")
+    args = parser.parse_args()
+    print(f"Exporting {EMBED_MODEL} to {args.out}")
+    export(EMBED_MODEL, args.out, quantize=not args.no_quantize)
+
+
+if __name__ == "__main__":
+    main()
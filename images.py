@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""Pictogram image delivery: inline base64 data URIs or content-hashed URLs served by app.py."""
+
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+PNG_DIR = BASE_DIR / "data" / "dyvogra-png"
+THUMB_DIR = BASE_DIR / "data" / "dyvogra-thumbs"
+DB_PATH = BASE_DIR / "pictograms.db"
+
+# "inline" embeds every image as a data URI; "url" emits <img src> pointing at IMAGE_URL_PREFIX
+IMAGE_MODE = os.environ.get("IMAGE_MODE", "inline").lower()
+IMAGE_URL_PREFIX = os.environ.get("IMAGE_URL_PREFIX", "/aacbot/img").rstrip("/")
+DIGEST_LEN = 16
+# base64 of the whole Dyvogra set is ~9 MB; the budget only matters for larger symbol sets
+IMAGE_CACHE_BYTES = int(os.environ.get("IMAGE_CACHE_BYTES", 32 * 1024 * 1024))
+IMAGE_PRELOAD = os.environ.get("IMAGE_PRELOAD", "1") == "1"
+IMAGE_DPR = 2  # renditions are chosen to stay sharp on HiDPI screens
+PRELOAD_SIZES = (96, 80)  # CSS px the inline renderers ask for (phrase strip, grid), preloaded first
+
+# precompressed siblings ("x.png.br", "x.png.gz") in order of preference
+ENCODINGS = {"br": ".br", "gzip": ".gz"}
+MEDIA_TYPES = {".png": "image/png", ".webp": "image/webp"}
+
+
+def _locate(name: str) -> Path:
+    """Renditions ("x@96.png") live in THUMB_DIR, originals in PNG_DIR."""
+    return (THUMB_DIR if "@" in name else PNG_DIR) / name
+
+
+def _resolve(png_path: str | Path) -> Path:
+    """Map a stored path onto the image directory next to this file."""
+    return _locate(Path(png_path).name)
+
+
+@lru_cache(maxsize=1)
+def _renditions() -> dict[str, list[tuple[int, int, str]]]:
+    """Original PNG name → [(width, bytes, file), ...] from symbols.renditions, written by ingest."""
+    try:
+        conn = sqlite3.connect(f"{DB_PATH.as_uri()}?mode=ro", uri=True)  # never create an empty DB
+        try:
+            rows = conn.execute(
+                "SELECT png_path, renditions FROM symbols WHERE renditions IS NOT NULL"
+            ).fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return {}
+    by_name: dict[str, list[tuple[int, int, str]]] = {}
+    for png_path, raw in rows:
+        entries = []
+        for r in json.loads(raw):
+            path = THUMB_DIR / r["file"]
+            if path.is_file():
+                entries.append((r["width"], path.stat().st_size, r["file"]))
+        by_name[Path(png_path).name] = entries
+    return by_name
+
+
+def pick_rendition(png_path: str, size: int | None) -> str:
+    """Smallest file (by bytes) among renditions wide enough for `size` CSS px at IMAGE_DPR.
+
+    Falls back to the original PNG when no rendition fits or none were generated."""
+    name = Path(png_path).name
+    if size is None:
+        return name
+    fitting = [(nbytes, file) for width, nbytes, file in _renditions().get(name, ())
+               if width >= size * IMAGE_DPR]
+    return min(fitting)[1] if fitting else name
+
+
+def srcset(png_path: str, size: int) -> str:
+    """1x/2x srcset for <img> in URL mode, from the best rendition at each density."""
+    candidates = []
+    for dpr in (1, 2):
+        fitting = [(nbytes, file) for width, nbytes, file in _renditions().get(Path(png_path).name, ())
+                   if width >= size * dpr]
+        if fitting:
+            candidates.append(f"{image_url(min(fitting)[1])} {dpr}x")
+    return ", ".join(candidates)
+
+
+class ImageCache:
+    """Process-wide LRU of base64-encoded images, bounded by total encoded size."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = self.misses = self.evictions = 0
+        self._bytes = 0
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> str | None:
+        with self._lock:
+            b64 = self._entries.get(name)
+            if b64 is not None:
+                self._entries.move_to_end(name)
+                self.hits += 1
+                return b64
+            self.misses += 1
+        try:
+            b64 = base64.b64encode(_locate(name).read_bytes()).decode()
+        except OSError:
+            return None
+        self._put(name, b64)
+        return b64
+
+    def _put(self, name: str, b64: str):
+        if len(b64) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(name, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[name] = b64
+            self._bytes += len(b64)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def preload(self) -> int:
+        """Encode images up front until the budget is full: first the renditions
+        pick_rendition serves at PRELOAD_SIZES, then every other rendition and original.
+        Returns entries loaded."""
+        originals = sorted(PNG_DIR.glob("*.png"))
+        served = [pick_rendition(path.name, size) for size in PRELOAD_SIZES for path in originals]
+        rest = [path.name for path in sorted(THUMB_DIR.glob("*.*")) + originals]
+        for name in dict.fromkeys(served + rest):
+            path = _locate(name)
+            if path.suffix not in MEDIA_TYPES or not path.is_file():
+                continue
+            if self._bytes + path.stat().st_size * 4 // 3 > self.max_bytes:
+                break
+            self._put(name, base64.b64encode(path.read_bytes()).decode())
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        _digest.cache_clear()
+        _renditions.cache_clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+image_cache = ImageCache(IMAGE_CACHE_BYTES)
+
+
+def img_b64(png_path: str) -> str | None:
+    return image_cache.get(Path(png_path).name)
+
+
+@lru_cache(maxsize=None)
+def _digest(name: str) -> str | None:
+    try:
+        return hashlib.sha256(_locate(name).read_bytes()).hexdigest()[:DIGEST_LEN]
+    except OSError:
+        return None
+
+
+def image_digest(png_path: str | Path) -> str | None:
+    """Short content hash of an image, computed once per process (image_cache.clear() resets)."""
+    return _digest(_resolve(png_path).name)
+
+
+def image_url(png_path: str) -> str | None:
+    digest = image_digest(png_path)
+    if digest is None:
+        return None
+    return f"{IMAGE_URL_PREFIX}/{digest}/{_resolve(png_path).name}"
+
+
+def image_src(png_path: str, mode: str | None = None, size: int | None = None) -> str | None:
+    """Return what goes into src/url(): a data URI in inline mode, a cacheable URL otherwise.
+
+    With `size` (CSS px) the smallest rendition that stays sharp at that size is used."""
+    name = pick_rendition(png_path, size)
+    if (mode or IMAGE_MODE) == "url":
+        return image_url(name)
+    b64 = img_b64(name)
+    return f"data:{MEDIA_TYPES[Path(name).suffix]};base64,{b64}" if b64 else None
+
+
+def lookup(digest: str, name: str) -> Path | None:
+    """Resolve a served URL back to a file; None if unknown or the digest is stale."""
+    path = _locate(Path(name).name)
+    if path.name != name or path.suffix not in MEDIA_TYPES or not path.is_file():
+        return None
+    return path if image_digest(path) == digest else None
+
+
+def pick_encoding(path: Path, accept_encoding: str) -> tuple[Path, str | None]:
+    """Choose a precompressed sibling the client accepts, falling back to the file itself."""
+    accepted = {e.split(";")[0].strip() for e in accept_encoding.lower().split(",")}
+    for encoding, suffix in ENCODINGS.items():
+        candidate = path.with_name(path.name + suffix)
+        if encoding in accepted and candidate.is_file():
+            return candidate, encoding
+    return path, None
+
+
+def precompress(min_saving: float = 0.05):
+    """Write .gz (and .br when brotli is installed) siblings that are meaningfully smaller."""
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+
+    kept = 0
+    for path in sorted(PNG_DIR.glob("*.png")) + sorted(THUMB_DIR.glob("*.png")):
+        data = path.read_bytes()
+        variants = {".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants[".br"] = brotli.compress(data, quality=11)
+        for suffix, blob in variants.items():
+            target = path.with_name(path.name + suffix)
+            if len(blob) <= len(data) * (1 - min_saving):
+                target.write_bytes(blob)
+                kept += 1
+            elif target.exists():
+                target.unlink()
+    print(f"Wrote {kept} precompressed variants in {PNG_DIR} and {THUMB_DIR}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pictogram image maintenance")
+    parser.add_argument("command", choices=["precompress"])
+    parser.add_argument("--min-saving", type=float, default=0.05,
+                        help="Keep a variant only if it is at least this fraction smaller")
+    args = parser.parse_args()
+    precompress(args.min_saving)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,44 @@
 #!/usr/bin/env python3
-"""Ingest dyvogra symbols: convert SVGs to PNGs, embed and store in sqlite-vec."""
+"""Ingest dyvogra symbols: convert SVGs to PNGs, embed and store in sqlite-vec.
+
+Incremental: each source file's content hash is stored, so a re-run only re-renders and
+re-embeds new or changed symbols and removes symbols whose source file is gone."""
 
 import argparse
+import hashlib
+import io
+import json
 import shutil
 import sqlite3
 import struct
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import cairosvg
 import sqlite_vec
-from sentence_transformers import SentenceTransformer
+from PIL import Image
 from tqdm import tqdm
 
+import aliases
+from encoders import EMBED_BACKEND, load_encoder
+
 BASE_DIR = Path(__file__).resolve().parent
 SVG_DIR = BASE_DIR / "data" / "dyvogra"
 PNG_DIR = BASE_DIR / "data" / "dyvogra-png"
+THUMB_DIR = BASE_DIR / "data" / "dyvogra-thumbs"
 DB_PATH = BASE_DIR / "pictograms.db"
 
 EMBED_MODEL = "paraphrase-multilingual-MiniLM-L12-v2"
 EMBED_DIM = 384
 BATCH_SIZE = 128
 PNG_WIDTH = 256
+RENDITION_WIDTHS = (96, 192)  # 1x / 2x of the largest on-screen size (phrase strip is 96px)
+WEBP_QUALITY = 80
+
+# compressed KNN index (symbol_vss_q); floats stay in symbol_vss for re-ranking. Only sign bits:
+# an int8 index scanned slower than the float one at every size measured (bench.py quant)
+QUANT_COLUMNS = {"binary": f"bit[{EMBED_DIM}]"}
+QUANT_FUNCS = {"binary": "vec_quantize_binary(embedding)"}
 
 AUDIENCE_MAP = {"deti": "children", "dorosli": "adults"}
 
@@ -55,31 +73,97 @@ def parse_records() -> list[dict]:
             "tags": "",
             "doc_text": f"{name}. Category: {category}. Audience: {audience}.",
             "source_path": path,
+            "source_hash": hashlib.sha256(path.read_bytes()).hexdigest(),
             "png_path": None,
+            "renditions": [],
         })
     return records
 
 
-def convert_to_png(records: list[dict]):
-    PNG_DIR.mkdir(parents=True, exist_ok=True)
-    failed = 0
-    for rec in tqdm(records, desc="Converting to PNG"):
-        png_path = PNG_DIR / f"{rec['symbol_name']}.png"
-        if png_path.exists():
-            rec["png_path"] = str(png_path)
-            continue
-        src = rec["source_path"]
-        try:
+def _rasterize(job: dict) -> dict:
+    """Worker: write the full-size PNG and all renditions for one symbol.
+
+    Runs in a process pool — cairosvg is CPU-bound and holds the GIL."""
+    src, name, force = job["source_path"], job["symbol_name"], job["force"]
+    out = {"symbol_id": job["symbol_id"], "png_path": None, "renditions": [], "error": None}
+    png_path = PNG_DIR / f"{name}.png"
+    try:
+        if force or not png_path.exists():
             if src.suffix == ".png":
                 shutil.copy2(src, png_path)
             else:
                 cairosvg.svg2png(url=str(src), write_to=str(png_path), output_width=PNG_WIDTH)
-            rec["png_path"] = str(png_path)
-        except Exception as e:
-            print(f"  failed {rec['symbol_name']}: {e}")
-            failed += 1
+        out["png_path"] = str(png_path)
+    except Exception as e:
+        out["error"] = f"{name}: {e}"
+        return out
+
+    if not job["renditions"]:
+        return out
+    try:
+        for width in RENDITION_WIDTHS:
+            png = THUMB_DIR / f"{name}@{width}.png"
+            webp_path = png.with_suffix(".webp")
+            if force or not png.exists() or (job["webp"] and not webp_path.exists()):
+                img = _render_width(src, width)
+                img.save(png, format="PNG", optimize=True)
+                if job["webp"]:
+                    img.save(webp_path, format="WEBP", quality=WEBP_QUALITY, method=6)
+            out["renditions"].append({"file": png.name, "width": width, "format": "png"})
+            if job["webp"] and webp_path.exists():
+                out["renditions"].append({"file": webp_path.name, "width": width, "format": "webp"})
+    except Exception as e:
+        out["error"] = f"renditions for {name}: {e}"
+    return out
+
+
+def _render_width(src: Path, width: int) -> Image.Image:
+    """Rasterize an SVG straight at `width`, or downscale a source PNG to fit it."""
+    if src.suffix == ".svg":
+        data = cairosvg.svg2png(url=str(src), output_width=width)
+        return Image.open(io.BytesIO(data))
+    img = Image.open(src)
+    img.thumbnail((width, width * img.height // max(img.width, 1)), Image.LANCZOS)
+    return img
+
+
+def rasterize(records: list[dict], changed: set[str], renditions: bool, webp: bool, workers: int | None):
+    """Produce PNGs and renditions, re-rendering only symbols whose source changed."""
+    PNG_DIR.mkdir(parents=True, exist_ok=True)
+    THUMB_DIR.mkdir(parents=True, exist_ok=True)
+    jobs = [{"symbol_id": r["symbol_id"], "symbol_name": r["symbol_name"], "source_path": r["source_path"],
+             "force": r["symbol_id"] in changed, "renditions": renditions, "webp": webp}
+            for r in records]
+    by_id = {r["symbol_id"]: r for r in records}
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for out in tqdm(pool.map(_rasterize, jobs, chunksize=8), total=len(jobs), desc="Rasterizing"):
+            rec = by_id[out["symbol_id"]]
+            rec["png_path"], rec["renditions"] = out["png_path"], out["renditions"]
+            if out["error"]:
+                print(f"  failed {out['error']}")
+                failed += 1
     if failed:
-        print(f"  {failed} conversions failed and will be skipped")
+        print(f"  {failed} conversions failed; affected symbols keep what was produced")
+
+
+def remove_files(symbol_names: list[str]):
+    """Delete the PNG and renditions of symbols whose source is gone."""
+    for name in symbol_names:
+        (PNG_DIR / f"{name}.png").unlink(missing_ok=True)
+        for path in THUMB_DIR.glob(f"{name}@*"):
+            path.unlink()
+
+
+def store_renditions(records: list[dict]):
+    """Record rendition lists in symbols.renditions (JSON)."""
+    conn = sqlite3.connect(DB_PATH)
+    conn.executemany(
+        "UPDATE symbols SET renditions = ? WHERE symbol_id = ?",
+        [(json.dumps(r["renditions"]), r["symbol_id"]) for r in records if r.get("renditions")],
+    )
+    conn.commit()
+    conn.close()
 
 
 def open_db() -> sqlite3.Connection:
@@ -90,6 +174,55 @@ def open_db() -> sqlite3.Connection:
     return conn
 
 
+def create_tables(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS symbols (
+            symbol_id    TEXT PRIMARY KEY,
+            symbol_name  TEXT,
+            display_name TEXT,
+            category     TEXT,
+            audience     TEXT,
+            grammar      TEXT,
+            tags         TEXT,
+            png_path     TEXT,
+            description  TEXT,
+            ai_title     TEXT,
+            ai_tags      TEXT,
+            source_hash  TEXT,
+            renditions   TEXT
+        )
+    """)
+    # DBs built before incremental ingest lack the newer columns
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(symbols)")}
+    for column in ("source_hash", "renditions"):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE symbols ADD COLUMN {column} TEXT")
+    # exact-name lookups (phrase resolution, the catalog query in llm.py)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_symbols_display_audience ON symbols(display_name, audience)")
+    conn.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS symbol_vss USING vec0(
+            symbol_id TEXT PRIMARY KEY,
+            embedding FLOAT[{EMBED_DIM}]
+        )
+    """)
+
+
+def load_source_hashes() -> dict[str, str | None]:
+    """symbol_id → source_hash of everything currently in the DB."""
+    if not DB_PATH.exists():
+        return {}
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(symbols)")}
+        if not columns:
+            return {}
+        if "source_hash" not in columns:
+            return {row[0]: None for row in conn.execute("SELECT symbol_id FROM symbols")}
+        return dict(conn.execute("SELECT symbol_id, source_hash FROM symbols").fetchall())
+    finally:
+        conn.close()
+
+
 def load_ai_metadata() -> dict[str, dict]:
     if not DB_PATH.exists():
         return {}
@@ -106,67 +239,68 @@ def load_ai_metadata() -> dict[str, dict]:
         conn.close()
 
 
-def embed_and_store(records: list[dict], force: bool):
-    valid = [r for r in records if r["png_path"] is not None]
-    ai = load_ai_metadata()
-    for r in valid:
-        meta = ai.get(r["symbol_id"])
-        if meta:
-            r["doc_text"] = (
-                f"{r['display_name']}. Category: {r['category']}. Audience: {r['audience']}."
-                f" Also described as: {meta['description']}"
-            )
-    print(f"Embedding {len(valid)} symbols ({len(ai)} with Opus vision metadata)...")
+_UPSERT_SQL = """
+    INSERT INTO symbols (symbol_id, symbol_name, display_name, category, audience, grammar, tags,
+                         png_path, description, ai_title, ai_tags, source_hash)
+    VALUES (?,?,?,?,?,?,?,?,?,?,?,?)
+    ON CONFLICT(symbol_id) DO UPDATE SET
+        symbol_name = excluded.symbol_name, display_name = excluded.display_name,
+        category = excluded.category, audience = excluded.audience, grammar = excluded.grammar,
+        tags = excluded.tags, png_path = excluded.png_path, source_hash = excluded.source_hash,
+        description = COALESCE(excluded.description, symbols.description),
+        ai_title = COALESCE(excluded.ai_title, symbols.ai_title),
+        ai_tags = COALESCE(excluded.ai_tags, symbols.ai_tags)
+"""
+
+
+def embed_and_store(records: list[dict], changed: set[str], removed: list[str], force: bool):
+    """Embed new/changed symbols, upsert them, and drop symbols whose source is gone.
 
+    Rows are upserted so columns maintained outside ingest (translations, AI metadata)
+    survive a re-embed."""
+    ai = load_ai_metadata()
     conn = open_db()
 
     if force:
         conn.execute("DROP TABLE IF EXISTS symbol_vss")
         conn.execute("DROP TABLE IF EXISTS symbols")
+    create_tables(conn)
 
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS symbols (
-            symbol_id    TEXT PRIMARY KEY,
-            symbol_name  TEXT,
-            display_name TEXT,
-            category     TEXT,
-            audience     TEXT,
-            grammar      TEXT,
-            tags         TEXT,
-            png_path     TEXT,
-            description  TEXT,
-            ai_title     TEXT,
-            ai_tags      TEXT
-        )
-    """)
-    conn.execute(f"""
-        CREATE VIRTUAL TABLE IF NOT EXISTS symbol_vss USING vec0(
-            symbol_id TEXT PRIMARY KEY,
-            embedding FLOAT[{EMBED_DIM}]
-        )
-    """)
+    if removed:
+        conn.executemany("DELETE FROM symbol_vss WHERE symbol_id = ?", [(sid,) for sid in removed])
+        conn.executemany("DELETE FROM symbols WHERE symbol_id = ?", [(sid,) for sid in removed])
+        print(f"Removed {len(removed)} symbols no longer in {SVG_DIR}")
 
-    existing = conn.execute("SELECT COUNT(*) FROM symbols").fetchone()[0]
-    if existing > 0 and not force:
-        print(f"DB already has {existing} symbols. Use --force to re-embed.")
-        conn.close()
-        return
+    todo = [r for r in records if r["png_path"] is not None and r["symbol_id"] in changed]
+    for r in todo:
+        meta = ai.get(r["symbol_id"])
+        if meta:
+            r["doc_text"] = (
+                f"{r['display_name']}. Category: {r['category']}. Audience: {r['audience']}."
+                f" Also described as: {meta['description']}"
+            )
+    print(f"Embedding {len(todo)} new or changed symbols ({len(ai)} with Opus vision metadata, "
+          f"{EMBED_BACKEND} encoder)...")
 
-    model = SentenceTransformer(EMBED_MODEL)
+    if todo:
+        model = load_encoder(EMBED_MODEL)
 
-    for i in tqdm(range(0, len(valid), BATCH_SIZE), desc="Embedding batches"):
-        batch = valid[i:i + BATCH_SIZE]
+    for i in tqdm(range(0, len(todo), BATCH_SIZE), desc="Embedding batches"):
+        batch = todo[i:i + BATCH_SIZE]
         embeddings = model.encode([r["doc_text"] for r in batch], normalize_embeddings=True)
         conn.executemany(
-            "INSERT OR REPLACE INTO symbols VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+            _UPSERT_SQL,
             [(r["symbol_id"], r["symbol_name"], r["display_name"],
               r["category"], r["audience"], r["grammar"], r["tags"], r["png_path"],
               ai.get(r["symbol_id"], {}).get("description"),
               ai.get(r["symbol_id"], {}).get("title"),
-              ai.get(r["symbol_id"], {}).get("tags")) for r in batch],
+              ai.get(r["symbol_id"], {}).get("tags"),
+              r["source_hash"]) for r in batch],
         )
+        # vec0 tables have no upsert: replace by delete + insert
+        conn.executemany("DELETE FROM symbol_vss WHERE symbol_id = ?", [(r["symbol_id"],) for r in batch])
         conn.executemany(
-            "INSERT OR REPLACE INTO symbol_vss VALUES (?, ?)",
+            "INSERT INTO symbol_vss VALUES (?, ?)",
             [(r["symbol_id"], struct.pack(f"{EMBED_DIM}f", *emb))
              for r, emb in zip(batch, embeddings)],
         )
@@ -176,10 +310,74 @@ def embed_and_store(records: list[dict], force: bool):
     print(f"Done. DB now has {count} symbols at {DB_PATH}")
 
 
+def quantized_kind(conn: sqlite3.Connection) -> str | None:
+    """Kind of the existing symbol_vss_q table ("binary"), or None if absent or of an unsupported kind."""
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'symbol_vss_q'").fetchone()
+    if row is None:
+        return None
+    return next((kind for kind, col in QUANT_COLUMNS.items() if col.split("[")[0] + "[" in row[0]), None)
+
+
+def build_quantized(kind: str | None):
+    """(Re)build symbol_vss_q from the float vectors — no re-encoding needed.
+
+    Runs when --quantize is given, and keeps an existing index in sync otherwise."""
+    conn = open_db()
+    kind = kind or quantized_kind(conn)
+    if kind is None:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'symbol_vss_q'").fetchone():
+            conn.execute("DROP TABLE symbol_vss_q")  # e.g. an int8 index from an earlier version
+            conn.commit()
+            print("Dropped symbol_vss_q of an unsupported kind; rebuild with --quantize binary")
+        conn.close()
+        return
+    conn.execute("DROP TABLE IF EXISTS symbol_vss_q")
+    conn.execute(f"""
+        CREATE VIRTUAL TABLE symbol_vss_q USING vec0(
+            symbol_id TEXT PRIMARY KEY,
+            embedding {QUANT_COLUMNS[kind]}
+        )
+    """)
+    conn.execute(f"INSERT INTO symbol_vss_q SELECT symbol_id, {QUANT_FUNCS[kind]} FROM symbol_vss")
+    conn.commit()
+    count = conn.execute("SELECT COUNT(*) FROM symbol_vss_q").fetchone()[0]
+    conn.close()
+    print(f"Built {kind} index symbol_vss_q with {count} vectors")
+
+
+def build_aliases():
+    """Rebuild symbol_aliases (normalized name / Ukrainian name / tag → symbol_id) from symbols.
+
+    Cheap, so it runs on every ingest; re-run after editing translations or AI tags."""
+    conn = open_db()
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(symbols)")}
+    name_uk = "display_name_uk" if "display_name_uk" in columns else "NULL"
+    rows = conn.execute(f"SELECT symbol_id, display_name, {name_uk}, ai_tags FROM symbols").fetchall()
+    conn.execute("DROP TABLE IF EXISTS symbol_aliases")
+    conn.execute("""
+        CREATE TABLE symbol_aliases (
+            alias     TEXT NOT NULL,
+            symbol_id TEXT NOT NULL,
+            source    TEXT NOT NULL,
+            PRIMARY KEY (alias, symbol_id)
+        )
+    """)
+    conn.executemany("INSERT INTO symbol_aliases VALUES (?, ?, ?)", aliases.build(rows))
+    conn.commit()
+    count = conn.execute("SELECT COUNT(DISTINCT alias) FROM symbol_aliases").fetchone()[0]
+    conn.close()
+    print(f"Built symbol_aliases with {count} aliases")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Ingest dyvogra symbols into sqlite-vec")
-    parser.add_argument("--force", action="store_true", help="Re-embed even if DB exists")
+    parser.add_argument("--force", action="store_true", help="Rebuild everything from scratch")
     parser.add_argument("--skip-png", action="store_true", help="Skip SVG→PNG conversion")
+    parser.add_argument("--skip-renditions", action="store_true", help="Skip thumbnail renditions")
+    parser.add_argument("--webp", action="store_true", help="Also write WebP renditions")
+    parser.add_argument("--workers", type=int, default=None, help="Rasterizer processes (default: CPU count)")
+    parser.add_argument("--quantize", choices=sorted(QUANT_COLUMNS),
+                        help="Build a compressed (sign-bit) KNN index for VECTOR_ENGINE=quantized")
     args = parser.parse_args()
 
     if not SVG_DIR.exists():
@@ -190,14 +388,26 @@ def main():
     records = parse_records()
     print(f"  Found {len(records)} symbols")
 
+    stored = {} if args.force else load_source_hashes()
+    current = {r["symbol_id"] for r in records}
+    changed = {r["symbol_id"] for r in records if stored.get(r["symbol_id"]) != r["source_hash"]}
+    removed = sorted(set(stored) - current)
+    print(f"  {len(changed)} new or changed, {len(records) - len(changed)} unchanged, {len(removed)} removed")
+
     if not args.skip_png:
-        convert_to_png(records)
+        rasterize(records, changed, renditions=not args.skip_renditions, webp=args.webp, workers=args.workers)
     else:
         for rec in records:
             png_path = PNG_DIR / f"{rec['symbol_name']}.png"
             rec["png_path"] = str(png_path) if png_path.exists() else None
+    remove_files(removed)
+
+    embed_and_store(records, changed, removed, force=args.force)
+    build_quantized(args.quantize)
+    build_aliases()
 
-    embed_and_store(records, force=args.force)
+    if not args.skip_png and not args.skip_renditions:
+        store_renditions(records)
 
 
 if __name__ == "__main__":
@@ -1,17 +1,44 @@
 """LLM query understanding: converts a situation description into search keywords and phrase."""
 
+import asyncio
+import hashlib
 import json
 import os
 import sqlite3
-from collections import defaultdict
+import threading
+from collections import OrderedDict, defaultdict
 from functools import lru_cache
 from pathlib import Path
 
 import anthropic
 
+from cache import PersistentCache
+
 BASE_DIR = Path(__file__).resolve().parent
 DB_PATH = BASE_DIR / "pictograms.db"
 
+EXPAND_MODEL = "claude-sonnet-4-6"
+# expansions persist across restarts and are shared by all workers on the host
+EXPANSION_CACHE_PATH = Path(os.environ.get("EXPANSION_CACHE_PATH", BASE_DIR / "expansions.db"))
+EXPANSION_CACHE_TTL = float(os.environ.get("EXPANSION_CACHE_TTL", 30 * 24 * 3600))
+EXPANSION_CACHE_MAX = int(os.environ.get("EXPANSION_CACHE_MAX", 50_000))
+RECENT_MAX = 512  # in-process LRU in front of the persistent cache
+# seconds an expansion may take: app.py stops waiting after this; the sync client (warm-up,
+# scripts) gives up, so an API outage can't hold startup for the SDK's 10-minute default
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", 8))
+
+# "full" sends the whole catalog as one provider-cached system block; "slim" sends only the
+# catalog categories nearest the query (local vector lookup) — fewer tokens, no prompt cache
+EXPAND_CATALOG = os.environ.get("EXPAND_CATALOG", "full").lower()
+PROMPT_CACHE = os.environ.get("PROMPT_CACHE", "1") == "1"
+CATALOG_SLIM_CATEGORIES = int(os.environ.get("CATALOG_SLIM_CATEGORIES", 8))
+# "llm" always asks the model; "local-first" uses local_expand and asks the model only when the
+# local result is ambiguous; "local" never calls the API
+EXPAND_ENGINE = os.environ.get("EXPAND_ENGINE", "llm").lower()
+LOCAL_FALLBACK = os.environ.get("LOCAL_FALLBACK", "1") == "1"  # local expansion when the API fails
+# symbols the phrase rules lean on; their categories are in every slim catalog
+CATALOG_CORE_SYMBOLS = frozenset({"I", "want", "do not want", "yes", "no", "thank you"})
+
 
 def _read_api_key() -> str:
     env_file = BASE_DIR / ".env"
@@ -25,19 +52,30 @@ def _read_api_key() -> str:
     return os.environ.get("ANTHROPIC_API_KEY", "")
 
 
-def _get_client() -> anthropic.Anthropic:
+def _api_key() -> str:
     key = _read_api_key()
     if not key:
         raise RuntimeError(
             f"ANTHROPIC_API_KEY not found. Create {BASE_DIR / '.env'} with ANTHROPIC_API_KEY=sk-ant-..."
         )
-    return anthropic.Anthropic(api_key=key)
+    return key
+
+
+@lru_cache(maxsize=1)
+def _get_client() -> anthropic.Anthropic:
+    return anthropic.Anthropic(api_key=_api_key(), timeout=LLM_TIMEOUT, max_retries=0)
+
+
+@lru_cache(maxsize=1)
+def _get_async_client() -> anthropic.AsyncAnthropic:
+    return anthropic.AsyncAnthropic(api_key=_api_key())
 
 
-def _build_catalog() -> str:
-    """Build compact symbol catalog: display_name plus distinctive ai_tags grouped by category."""
+@lru_cache(maxsize=1)
+def _catalog_entries() -> dict[str, list[str]]:
+    """Symbol catalog by category: display_name plus distinctive ai_tags."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = sqlite3.connect(f"{DB_PATH.as_uri()}?mode=ro", uri=True)  # never create an empty DB
         rows = conn.execute("""
             SELECT display_name, category, ai_tags
             FROM symbols
@@ -59,17 +97,32 @@ def _build_catalog() -> str:
             distinctive = [t for t in tags if t.lower() not in name_words][:3]
             entry = f"{name} ({', '.join(distinctive)})" if distinctive else name
             by_cat[cat].append(entry)
-        return "\n".join(f"{cat}: {', '.join(entries)}" for cat, entries in sorted(by_cat.items()))
+        return dict(by_cat)
     except Exception:
-        return ""
+        return {}
 
 
-_CATALOG = _build_catalog()
+def _build_catalog(categories=None) -> str:
+    """Compact catalog text, one line per category; `categories` restricts it to a slice."""
+    by_cat = _catalog_entries()
+    wanted = by_cat.keys() if categories is None else set(categories) & by_cat.keys()
+    return "\n".join(f"{cat}: {', '.join(by_cat[cat])}" for cat in sorted(wanted))
 
-EXPAND_SYSTEM = (
+
+@lru_cache(maxsize=1)
+def _core_categories() -> frozenset[str]:
+    """Categories of CATALOG_CORE_SYMBOLS, always part of a slim catalog."""
+    return frozenset(
+        cat for cat, entries in _catalog_entries().items()
+        if any(e.split(" (")[0] in CATALOG_CORE_SYMBOLS for e in entries)
+    )
+
+
+_EXPAND_HEAD = (
     "You help build AAC (pictogram) communication sequences from natural language.\n\n"
     "AVAILABLE SYMBOLS (use EXACT names from this list):\n"
-    f"{_CATALOG}\n\n"
+)
+_EXPAND_TASKS = (
     "Tasks:\n"
     "1. keywords — 5-8 search terms covering ALL aspects of the situation.\n"
     "   Rules:\n"
@@ -98,32 +151,218 @@ EXPAND_SYSTEM = (
 )
 
 
-@lru_cache(maxsize=512)
-def expand_query(user_input: str) -> tuple[str, tuple[tuple[str, str], ...], str | None]:
-    """Return (keywords, phrase_parts, audience). phrase_parts is ((role, symbol), ...)."""
+@lru_cache(maxsize=1)
+def expand_system() -> str:
+    """System prompt with the symbol catalog, built from the DB on first use rather than at import."""
+    return f"{_EXPAND_HEAD}{_build_catalog()}\n\n{_EXPAND_TASKS}"
+
+
+def slim_categories(user_input: str) -> list[str]:
+    """Catalog categories for a slim prompt: core categories plus the ones nearest the query."""
+    from rag import nearest_categories  # imported late: llm alone must not load the encoder
+
+    nearest = nearest_categories(user_input, CATALOG_SLIM_CATEGORIES)
+    return sorted(_core_categories() | set(nearest))
+
+
+def _system(user_input: str) -> list[dict]:
+    """System prompt as content blocks.
+
+    The full prompt is identical on every call, so it is marked for the provider's prompt
+    cache. A slim prompt changes per query and is sent without a cache marker."""
+    if EXPAND_CATALOG == "slim":
+        text = f"{_EXPAND_HEAD}{_build_catalog(slim_categories(user_input))}\n\n{_EXPAND_TASKS}"
+        return [{"type": "text", "text": text}]
+    block = {"type": "text", "text": expand_system()}
+    if PROMPT_CACHE:
+        block["cache_control"] = {"type": "ephemeral"}
+    return [block]
+
+
+Expansion = tuple[str, tuple[tuple[str, str], ...], str | None]
+
+
+@lru_cache(maxsize=1)
+def _prompt_hash() -> str:
+    """Prompt + model fingerprint: a catalog or prompt change invalidates every cached expansion."""
+    return hashlib.sha256(f"{EXPAND_MODEL}\n{EXPAND_CATALOG}\n{expand_system()}".encode()).hexdigest()[:16]
+
+
+expansion_cache = PersistentCache(
+    EXPANSION_CACHE_PATH, "expansions", ttl=EXPANSION_CACHE_TTL, max_entries=EXPANSION_CACHE_MAX,
+)
+
+
+def normalize_query(user_input: str) -> str:
+    """Case- and whitespace-insensitive form of a query, minus trailing punctuation."""
+    return " ".join(user_input.casefold().split()).rstrip(" .!?")
+
+
+def _cache_key(user_input: str) -> str:
+    return hashlib.sha256(f"{_prompt_hash()}\n{normalize_query(user_input)}".encode()).hexdigest()
+
+
+def _parse_expansion(text: str, user_input: str) -> Expansion:
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("```")[1].lstrip("json").strip()
+    data = json.loads(text)
+    keywords = data.get("keywords", "").strip()
+    if not keywords or keywords.lower() == user_input.lower() or len(keywords.split()) > 12:
+        keywords = user_input
+    raw_parts = data.get("phrase_parts", [])
+    phrase_parts = tuple(
+        (str(p.get("role", "")).strip(), str(p.get("symbol", "")).strip())
+        for p in raw_parts
+        if str(p.get("symbol", "")).strip()
+    )
+    raw_aud = data.get("audience", "any").lower()
+    audience = raw_aud if raw_aud in ("children", "adults") else None
+    return keywords, phrase_parts, audience
+
+
+def _from_cache(value) -> Expansion:
+    keywords, parts, audience = value
+    return keywords, tuple((role, symbol) for role, symbol in parts), audience
+
+
+_recent: OrderedDict[str, Expansion] = OrderedDict()
+_recent_lock = threading.Lock()
+
+
+def _recalled(key: str) -> Expansion | None:
+    """The in-process LRU alone: no I/O, safe on the event loop."""
+    with _recent_lock:
+        if key in _recent:
+            _recent.move_to_end(key)
+            return _recent[key]
+    return None
+
+
+def _stored(key: str) -> Expansion | None:
+    """The persistent cache (SQLite, may wait on a writer's lock); hits are promoted into the LRU."""
+    cached = expansion_cache.get(key)
+    if cached is None:
+        return None
+    result = _from_cache(cached)
+    _remember(key, result)
+    return result
+
+
+def _cached(key: str) -> Expansion | None:
+    """In-process LRU first, then the persistent cache."""
+    cached = _recalled(key)
+    return cached if cached is not None else _stored(key)
+
+
+async def _cached_async(key: str, executor=None) -> Expansion | None:
+    """_cached with the persistent lookup on `executor`, so a locked DB never stalls the event loop."""
+    cached = _recalled(key)
+    if cached is not None:
+        return cached
+    return await asyncio.get_running_loop().run_in_executor(executor, _stored, key)
+
+
+def _remember(key: str, result: Expansion):
+    with _recent_lock:
+        _recent[key] = result
+        _recent.move_to_end(key)
+        while len(_recent) > RECENT_MAX:
+            _recent.popitem(last=False)
+
+
+async def cached_expansion_async(user_input: str, executor=None) -> Expansion | None:
+    """The cached expansion for `user_input`, without calling the API; SQLite reads run on `executor`."""
+    return await _cached_async(_cache_key(user_input), executor)
+
+
+def _local(user_input: str) -> tuple[Expansion, bool] | None:
+    """local_expand.expand_local, or None when the symbol data is unusable."""
+    from local_expand import expand_local  # imported late: llm alone must not load the encoder
+
     try:
-        response = _get_client().messages.create(
-            model="claude-sonnet-4-6",
-            max_tokens=256,
-            temperature=0,
-            system=EXPAND_SYSTEM,
-            messages=[{"role": "user", "content": user_input}],
-        )
-        text = response.content[0].text.strip()
-        if text.startswith("```"):
-            text = text.split("```")[1].lstrip("json").strip()
-        data = json.loads(text)
-        keywords = data.get("keywords", "").strip()
-        if not keywords or keywords.lower() == user_input.lower() or len(keywords.split()) > 12:
-            keywords = user_input
-        raw_parts = data.get("phrase_parts", [])
-        phrase_parts = tuple(
-            (str(p.get("role", "")).strip(), str(p.get("symbol", "")).strip())
-            for p in raw_parts
-            if str(p.get("symbol", "")).strip()
-        )
-        raw_aud = data.get("audience", "any").lower()
-        audience = raw_aud if raw_aud in ("children", "adults") else None
-        return keywords, phrase_parts, audience
+        return expand_local(user_input)
+    except Exception:
+        return None
+
+
+def _local_first(user_input: str) -> Expansion | None:
+    """The local expansion if EXPAND_ENGINE lets it answer without the LLM.
+
+    In "local" mode it always answers, so the API is never called; if the local engine
+    fails, that answer is the raw input, as fallback_expansion would give without a retry."""
+    if EXPAND_ENGINE == "llm":
+        return None
+    local = _local(user_input)
+    if EXPAND_ENGINE == "local":
+        return local[0] if local is not None else (user_input, (), None)
+    return local[0] if local is not None and local[1] else None
+
+
+def fallback_expansion(user_input: str) -> Expansion:
+    """What a failed or timed-out expansion returns: the local one, else the raw input."""
+    local = _local(user_input) if LOCAL_FALLBACK else None
+    return local[0] if local is not None else (user_input, (), None)
+
+
+def _request(user_input: str) -> dict:
+    return {
+        "model": EXPAND_MODEL,
+        "max_tokens": 256,
+        "temperature": 0,
+        "system": _system(user_input),
+        "messages": [{"role": "user", "content": user_input}],
+    }
+
+
+def expand_query(user_input: str) -> Expansion:
+    """Return (keywords, phrase_parts, audience). phrase_parts is ((role, symbol), ...).
+
+    Successful expansions are cached in-process and in the persistent cache shared by
+    all workers; local expansions and the fallback on API errors are never cached."""
+    key = _cache_key(user_input)
+    cached = _cached(key)
+    if cached is not None:
+        return cached
+    local = _local_first(user_input)
+    if local is not None:
+        return local
+    try:
+        response = _get_client().messages.create(**_request(user_input))
+        result = _parse_expansion(response.content[0].text, user_input)
+    except Exception:
+        return fallback_expansion(user_input)
+    _remember(key, result)
+    expansion_cache.set(key, result)
+    return result
+
+
+async def expand_query_async(user_input: str, executor=None, fallback: bool = True) -> Expansion:
+    """expand_query on the async Anthropic client, sharing the same caches.
+
+    Blocking work (persistent cache I/O, local encodes, the slim catalog) runs on `executor`
+    (the default one if None), never on the event loop. With fallback=False an API error
+    is raised instead of answered with fallback_expansion, so the caller can tell them apart."""
+    loop = asyncio.get_running_loop()
+    key = _cache_key(user_input)
+    cached = await _cached_async(key, executor)
+    if cached is not None:
+        return cached
+    local = await loop.run_in_executor(executor, _local_first, user_input) if EXPAND_ENGINE != "llm" else None
+    if local is not None:
+        return local
+    try:
+        if EXPAND_CATALOG == "slim":
+            request = await loop.run_in_executor(executor, _request, user_input)
+        else:
+            request = _request(user_input)
+        response = await _get_async_client().messages.create(**request)
+        result = _parse_expansion(response.content[0].text, user_input)
     except Exception:
-        return user_input, (), None
+        if not fallback:
+            raise
+        return await loop.run_in_executor(executor, fallback_expansion, user_input)
+    _remember(key, result)
+    # not awaited: the caller has its answer, and PersistentCache.set swallows SQLite errors
+    loop.run_in_executor(executor, expansion_cache.set, key, result)
+    return result
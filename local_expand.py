@@ -0,0 +1,115 @@
+"""Local query expansion: keywords and phrase_parts from the symbol data, without an LLM call.
+
+llm.expand_query uses it as the first tier (EXPAND_ENGINE=local-first / local) and as the
+fallback when the API fails or times out. The query is normalized (aliases.normalize) and
+scanned once, longest n-gram first, against cue words, COMMUNICATION_TRIGGERS and the alias index.
+Content words left over go through one batched encode + KNN. Parts are then ordered by role."""
+
+from functools import lru_cache
+
+import aliases
+from rag import COMMUNICATION_TRIGGERS, PHRASE_MAX, Lookups, _knn, _lookups, encode_texts
+
+LOCAL_MATCH_THRESHOLD = 0.90  # a leftover word maps to its nearest symbol only within this distance
+LOCAL_MAX_WORDS = 10          # longer inputs count as ambiguous and go to the LLM in local-first mode
+MAX_NGRAM = 4
+
+# AAC sentence order: subject → feeling/symptom → want → action/object → person/place
+ROLE_ORDER = ("response", "subject", "feeling", "symptom", "condition", "want",
+              "action", "object", "person", "place")
+ROLE_BY_CATEGORY = {
+    "communication": "response", "signals": "response", "pronouns": "subject",
+    "emotions": "feeling", "health": "condition", "pandemics": "symptom", "adjectives": "condition",
+    "actions": "action", "family": "person",
+}
+ROLE_BY_NAME = {
+    "I": "subject", "want": "want", "do not want": "feeling", "dont want": "feeling",
+    "do not understand": "feeling",
+    "doctor man": "person", "doctor woman": "person", "nurse": "person",
+    "hospital": "place", "stay at hospital": "place",
+}
+
+# cue n-grams (normalized) → display_name; they win over aliases of the same span
+CUES = {
+    "i": "I", "me": "I", "my": "I", "я": "I", "мені": "I", "мене": "I", "мій": "I", "моя": "I",
+    "want": "want", "need": "want", "would like": "want", "wanna": "want",
+    "хочу": "want", "хоче": "want", "треба": "want", "потрібно": "want",
+    "do not want": "do not want", "does not want": "do not want", "did not want": "do not want",
+    "refuse": "do not want", "refuses": "do not want", "не хочу": "do not want", "не хоче": "do not want",
+}
+CHILD_CUES = frozenset({
+    "child", "children", "kid", "kids", "baby", "son", "daughter", "boy", "girl",
+    "дитина", "дитині", "дитину", "діти", "син", "донька", "малюк",
+})
+STOPWORDS = frozenset({
+    "a", "an", "the", "to", "and", "or", "but", "is", "am", "are", "was", "were", "be", "been", "of",
+    "in", "on", "at", "for", "with", "it", "its", "this", "that", "so", "very", "too", "just",
+    "really", "please", "also", "feel", "feels", "go", "get", "not", "do", "does",
+    "і", "й", "та", "а", "але", "в", "у", "на", "до", "з", "із", "що", "це", "дуже", "не",
+})
+
+
+@lru_cache(maxsize=1)
+def _ngrams(lookups: Lookups) -> dict[str, str]:
+    """Normalized n-gram → display_name: aliases, then COMMUNICATION_TRIGGERS, then cues on top."""
+    table = dict(lookups.aliases)
+    for concept, patterns in COMMUNICATION_TRIGGERS.items():
+        rows = [r for p in patterns for r in lookups.by_trigger.get(p, ())]
+        if rows:
+            table[aliases.normalize(concept)] = rows[0][0]
+    table.update((cue, name) for cue, name in CUES.items() if name in lookups.by_name)
+    return table
+
+
+def _role(lookups: Lookups, name: str) -> str:
+    if name in ROLE_BY_NAME:
+        return ROLE_BY_NAME[name]
+    rows = lookups.by_name.get(name)
+    return ROLE_BY_CATEGORY.get(rows[0][1], "object") if rows else "object"
+
+
+def expand_local(user_input: str) -> tuple[tuple[str, tuple[tuple[str, str], ...], str | None], bool]:
+    """Return ((keywords, phrase_parts, audience), confident).
+
+    Not confident when a content word matched no symbol, nothing matched at all, or the
+    input is longer than LOCAL_MAX_WORDS; local-first mode hands those to the LLM."""
+    lookups = _lookups()
+    table = _ngrams(lookups)
+    tokens = aliases.normalize(user_input).split()
+
+    found: list[tuple[int, str]] = []  # (token position, display_name)
+    leftover: list[tuple[int, str]] = []
+    audience = "children" if CHILD_CUES.intersection(tokens) else None
+    i = 0
+    while i < len(tokens):
+        for n in range(min(MAX_NGRAM, len(tokens) - i), 0, -1):
+            key = " ".join(tokens[i:i + n])
+            if key in table and (n > 1 or key not in STOPWORDS or key in CUES):
+                found.append((i, table[key]))
+                i += n
+                break
+        else:
+            token = tokens[i]
+            if token not in STOPWORDS and token not in CHILD_CUES:
+                leftover.append((i, token))
+            i += 1
+
+    unmatched = []
+    if leftover:
+        words = [w for _, w in leftover]
+        embeddings = encode_texts(words)
+        for (pos, word), rows in zip(leftover, _knn([embeddings[w] for w in words], 1)):
+            if rows and rows[0][4] <= LOCAL_MATCH_THRESHOLD:
+                found.append((pos, rows[0][0]))
+            else:
+                unmatched.append(word)
+
+    names = list(dict.fromkeys(name for _, name in sorted(found)))
+    if "do not want" in names and "want" in names:
+        names.remove("want")
+    ranked = sorted(names, key=lambda name: ROLE_ORDER.index(_role(lookups, name)))
+    parts = tuple((_role(lookups, name), name) for name in ranked[:PHRASE_MAX])
+
+    keywords = ", ".join(dict.fromkeys(names + unmatched)) or user_input
+    confident = bool(parts) and not unmatched and len(tokens) <= LOCAL_MAX_WORDS
+    return (keywords, parts, audience), confident
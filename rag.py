@@ -1,12 +1,21 @@
-"""RAG retrieval using sqlite-vec. Module-level model loads once at import time."""
+"""RAG retrieval using sqlite-vec. The encoder loads lazily (load_model) on first encode or at startup."""
 
+import base64
+import os
+import re
 import sqlite3
 import struct
-from collections import defaultdict
+import threading
+from collections import OrderedDict, defaultdict
+from functools import lru_cache
 from pathlib import Path
 
+import numpy as np
 import sqlite_vec
-from sentence_transformers import SentenceTransformer
+
+import aliases
+from cache import PersistentCache
+from encoders import EMBED_BACKEND, load_encoder
 
 BASE_DIR = Path(__file__).resolve().parent
 DB_PATH = BASE_DIR / "pictograms.db"
@@ -66,47 +75,475 @@ COMMUNICATION_TRIGGERS = {
     "don't understand": ["_____do_not_understand___"],
     "don't want":       ["_____do_not_want___", "_____dont_want___"],
 }
+
+_TOKEN_RE = re.compile(r"[\w']+")
+
+
+def _tokens(text: str) -> list[str]:
+    return _TOKEN_RE.findall(text.lower().replace("\u2019", "'"))
+
+
+class PhraseMatcher:
+    """Finds which trigger phrases occur in a text as whole words, in one pass.
+
+    Phrases are stored as token tuples in a dict, so a scan costs
+    O(words × longest phrase) regardless of how many phrases there are, and
+    "one" no longer matches inside "someone"."""
+
+    def __init__(self, phrases):
+        self._phrases: dict[tuple[str, ...], set[str]] = defaultdict(set)
+        for phrase in phrases:
+            key = tuple(_tokens(phrase))
+            if key:
+                self._phrases[key].add(phrase)
+        self._max_len = max(map(len, self._phrases), default=0)
+
+    def find(self, text: str) -> set[str]:
+        """The original phrases found in `text`."""
+        words = _tokens(text)
+        found: set[str] = set()
+        for i in range(len(words)):
+            for n in range(1, min(self._max_len, len(words) - i) + 1):
+                hit = self._phrases.get(tuple(words[i:i + n]))
+                if hit:
+                    found |= hit
+        return found
+
+
 SYMBOL_THRESHOLD = 1.20   # individual symbols shown up to this distance
 RELATIVE_SPREAD = 0.06    # within category, only show symbols within this of the best match
 MAX_PER_CATEGORY = 5      # max symbols shown per category
-
-_model = SentenceTransformer(EMBED_MODEL)
+SPLIT_MIN_KEYWORDS = 6    # multi-aspect queries: also search keyword groups separately
+KEYWORD_SPLITS = 2        # number of keyword groups for multi-aspect queries
+PHRASE_MAX = 5           # max symbols in a phrase strip
+PHRASE_FALLBACK_THRESHOLD = 1.20  # vector search fallback threshold
+FUZZY_MEMO_MAX = 4096     # fuzzy alias resolutions remembered per Lookups
+
+_CONDITIONAL_BY_TRIGGER: dict[str, set[str]] = defaultdict(set)
+for _symbol, _triggers in CONDITIONAL_SYMBOLS.items():
+    for _trigger in _triggers:
+        _CONDITIONAL_BY_TRIGGER[_trigger].add(_symbol)
+_CONDITIONAL_MATCHER = PhraseMatcher(_CONDITIONAL_BY_TRIGGER)
+_COMMUNICATION_MATCHER = PhraseMatcher(COMMUNICATION_TRIGGERS)
+_COMMUNICATION_ORDER = {word: i for i, word in enumerate(COMMUNICATION_TRIGGERS)}
+
+
+def _allowed_conditionals(query: str) -> set[str]:
+    """CONDITIONAL_SYMBOLS whose trigger words occur in the query."""
+    allowed: set[str] = set()
+    for trigger in _CONDITIONAL_MATCHER.find(query):
+        allowed |= _CONDITIONAL_BY_TRIGGER[trigger]
+    return allowed
+
+
+def _communication_words(query: str) -> list[str]:
+    """COMMUNICATION_TRIGGERS keys occurring in the query, in table order."""
+    return sorted(_COMMUNICATION_MATCHER.find(query), key=_COMMUNICATION_ORDER.__getitem__)
+
+# "sqlite": KNN via sqlite-vec MATCH; "numpy": exact KNN over an in-memory matrix (MatrixIndex);
+# "quantized": coarse KNN on symbol_vss_q (ingest --quantize), re-ranked on the float vectors
+VECTOR_ENGINE = os.environ.get("VECTOR_ENGINE", "sqlite").lower()
+QUANT_OVERSAMPLE = int(os.environ.get("QUANT_OVERSAMPLE", 4))  # coarse candidates per requested result
+MATRIX_BLOCK_ROWS = 512  # MatrixIndex rows scored per pass, small enough to stay in cache across queries
+
+EMBED_CACHE_SIZE = int(os.environ.get("EMBED_CACHE_SIZE", 4096))  # query/keyword vectors kept in memory
+EMBED_CACHE_PATH = os.environ.get("EMBED_CACHE_PATH", "")         # optional SQLite file to persist them
+EMBED_CACHE_TTL = float(os.environ.get("EMBED_CACHE_TTL", 90 * 24 * 3600))
+
+SQLITE_MMAP_SIZE = 64 * 1024 * 1024  # whole DB fits; reads come straight from the page cache
+SQLITE_STATEMENT_CACHE = 64          # prepared statements kept per connection
+
+_KNN_SQL = """
+    SELECT s.display_name, s.category, s.audience, s.png_path, v.distance,
+           s.display_name_uk, s.category_uk, s.symbol_id
+    FROM symbol_vss v
+    JOIN symbols s ON s.symbol_id = v.symbol_id
+    WHERE v.embedding MATCH ? AND k = ?
+    ORDER BY v.distance
+"""
+# {quantize} is filled in from the kind of symbol_vss_q; distances come from the float vectors
+_QUANT_SQL = """
+    WITH coarse AS (
+        SELECT symbol_id FROM symbol_vss_q WHERE embedding MATCH {quantize} AND k = ?
+    )
+    SELECT s.display_name, s.category, s.audience, s.png_path,
+           vec_distance_l2(v.embedding, ?) AS distance, s.display_name_uk, s.category_uk,
+           s.symbol_id
+    FROM coarse
+    JOIN symbol_vss v ON v.symbol_id = coarse.symbol_id
+    JOIN symbols s ON s.symbol_id = coarse.symbol_id
+    ORDER BY distance
+    LIMIT ?
+"""
+_QUANTIZE_EXPR = {"bit[": "vec_quantize_binary(?)"}
+_INDEX_SQL = """
+    SELECT v.embedding, s.display_name, s.category, s.audience, s.png_path,
+           s.display_name_uk, s.category_uk, s.symbol_id
+    FROM symbol_vss v
+    JOIN symbols s ON s.symbol_id = v.symbol_id
+"""
+_SYMBOLS_SQL = (
+    "SELECT symbol_name, display_name, category, audience, png_path, display_name_uk, category_uk, "
+    "symbol_id FROM symbols"
+)
+_ALIASES_SQL = "SELECT a.alias, s.display_name FROM symbol_aliases a JOIN symbols s ON s.symbol_id = a.symbol_id"
+_ALIAS_SOURCE_SQL = "SELECT symbol_id, display_name, display_name_uk, ai_tags FROM symbols"
+
+_model = None
+_model_lock = threading.Lock()
+
+_local = threading.local()
 
 
 def _open_db() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
+    """Open a read-only connection with sqlite-vec loaded and read pragmas applied."""
+    conn = sqlite3.connect(
+        f"{DB_PATH.as_uri()}?mode=ro", uri=True,
+        check_same_thread=False, cached_statements=SQLITE_STATEMENT_CACHE,
+    )
     conn.enable_load_extension(True)
     sqlite_vec.load(conn)
     conn.enable_load_extension(False)
+    conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+    conn.execute("PRAGMA query_only = ON")
     return conn
 
 
-def _query_once(query: str, n_results: int, audience: str | None, strong_threshold: float) -> list[dict]:
-    embedding = _model.encode(query, normalize_embeddings=True)
-    query_blob = struct.pack(f"{EMBED_DIM}f", *embedding)
-
-    conn = _open_db()
-    rows = conn.execute(
-        """
-        SELECT s.display_name, s.category, s.audience, s.png_path, v.distance,
-               s.display_name_uk, s.category_uk
-        FROM symbol_vss v
-        JOIN symbols s ON s.symbol_id = v.symbol_id
-        WHERE v.embedding MATCH ? AND k = ?
-        ORDER BY v.distance
-        """,
-        (query_blob, n_results),
-    ).fetchall()
-    conn.close()
-
-    all_results = [
+def load_model():
+    """The EMBED_BACKEND encoder, loaded on first use: importing torch alone takes seconds,
+    so neither importing rag nor binding the server waits for it."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = load_encoder(EMBED_MODEL)
+    return _model
+
+
+def _db() -> sqlite3.Connection:
+    """Return the calling thread's warm connection, opening it on first use.
+
+    Gradio and uvicorn reuse a bounded set of worker threads, so there is
+    at most one connection per worker for the lifetime of the process."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _open_db()
+        _local.conn = conn
+    return conn
+
+
+class MatrixIndex:
+    """All symbol embeddings as one contiguous float32 matrix, metadata in a parallel list.
+
+    Top-k is a dot product per query plus argpartition. Several queries are scored block by
+    block, so each block of the matrix is read from memory once for all of them; BLAS gemm
+    with a handful of query rows was slower than scoring them one at a time. Distances are L2 between unit vectors, the same metric vec0 reports, so the
+    retrieval thresholds apply unchanged."""
+
+    def __init__(self, matrix: np.ndarray, meta: list[tuple]):
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        self.meta = meta  # (display_name, category, audience, png_path, display_name_uk, category_uk, symbol_id)
+
+    @classmethod
+    def load(cls, conn: sqlite3.Connection) -> "MatrixIndex":
+        rows = conn.execute(_INDEX_SQL).fetchall()
+        matrix = np.frombuffer(b"".join(r[0] for r in rows), dtype=np.float32).reshape(len(rows), EMBED_DIM)
+        return cls(matrix, [tuple(r[1:]) for r in rows])
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        """Cosine similarity of every query row to every symbol, shape (queries, symbols)."""
+        if len(queries) == 1 or len(self.matrix) <= MATRIX_BLOCK_ROWS:
+            return queries @ self.matrix.T
+        scores = np.empty((len(queries), len(self.matrix)), dtype=np.float32)
+        for start in range(0, len(self.matrix), MATRIX_BLOCK_ROWS):
+            block = self.matrix[start:start + MATRIX_BLOCK_ROWS]
+            for row, query in zip(scores, queries):
+                np.dot(block, query, out=row[start:start + len(block)])
+        return scores
+
+    def search(self, queries: np.ndarray, k: int) -> list[list[tuple]]:
+        """KNN rows shaped like _KNN_SQL's, one list per query row, nearest first."""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        k = min(k, len(self.meta))
+        if k == 0:
+            return [[] for _ in queries]
+        scores = self._scores(queries)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        distances = np.sqrt(np.maximum(2.0 - 2.0 * np.take_along_axis(top_scores, order, axis=1), 0.0))
+        results = []
+        for idx_row, dist_row in zip(top, distances):
+            results.append([
+                (*self.meta[i][:4], float(d), *self.meta[i][4:]) for i, d in zip(idx_row, dist_row)
+            ])
+        return results
+
+
+@lru_cache(maxsize=1)
+def _index() -> MatrixIndex:
+    return MatrixIndex.load(_db())
+
+
+class Lookups:
+    """Symbol rows keyed for O(1) resolution, built once from one scan of `symbols`.
+
+    Rows are (display_name, category, audience, png_path, display_name_uk, category_uk, symbol_id).
+    `aliases` maps normalized alias keys (see aliases.py) to a display_name."""
+
+    def __init__(self, rows: list[tuple], alias_names: dict[str, str] | None = None):
+        self.aliases = alias_names or {}
+        self._alias_keys = list(self.aliases)
+        # lru_cache is thread-safe; resolve runs on every CPU worker thread
+        self._fuzzy = lru_cache(maxsize=FUZZY_MEMO_MAX)(self._closest)
+        self.by_name: dict[str, list[tuple]] = defaultdict(list)
+        self.by_name_audience: dict[tuple[str, str], list[tuple]] = defaultdict(list)
+        self.by_trigger: dict[str, list[tuple]] = {}
+        for symbol_name, *row in rows:
+            row = tuple(row)
+            self.by_name[row[0]].append(row)
+            self.by_name_audience[(row[0], row[2])].append(row)
+        patterns = {p for ps in COMMUNICATION_TRIGGERS.values() for p in ps}
+        for pattern in patterns:
+            self.by_trigger[pattern] = [tuple(r[1:]) for r in rows if pattern in r[0]]
+
+    def named(self, name: str, audience: str | None) -> list[tuple]:
+        """Rows for an exact display_name, requested audience first-choice, else any."""
+        if audience is not None and (name, audience) in self.by_name_audience:
+            return self.by_name_audience[(name, audience)]
+        return self.by_name.get(name, [])
+
+    def resolve(self, concept: str) -> str | None:
+        """display_name for a phrase concept: exact name, then normalized alias, then fuzzy alias."""
+        if concept in self.by_name:
+            return concept
+        key = aliases.normalize(concept)
+        if key in self.aliases:
+            return self.aliases[key]
+        return self._fuzzy(key)
+
+    def _closest(self, key: str) -> str | None:
+        match = aliases.closest(key, self._alias_keys)
+        return self.aliases[match] if match else None
+
+
+def _load_aliases(conn: sqlite3.Connection) -> dict[str, str]:
+    """symbol_aliases as built by ingest; derived from `symbols` for DBs that predate it."""
+    try:
+        return dict(conn.execute(_ALIASES_SQL).fetchall())
+    except sqlite3.OperationalError:
+        rows = conn.execute(_ALIAS_SOURCE_SQL).fetchall()
+        by_id = {sid: name for sid, name, *_ in rows}
+        return {alias: by_id[sid] for alias, sid, _ in aliases.build(rows)}
+
+
+@lru_cache(maxsize=1)
+def _lookups() -> Lookups:
+    conn = _db()
+    return Lookups(conn.execute(_SYMBOLS_SQL).fetchall(), _load_aliases(conn))
+
+
+def load_indexes() -> None:
+    """Build the in-memory lookups (and the matrix for VECTOR_ENGINE=numpy) ahead of the first search."""
+    _lookups()
+    if VECTOR_ENGINE == "numpy":
+        _index()
+
+
+def reload_index() -> None:
+    """Drop in-memory indexes; the next search reloads them from the DB."""
+    _index.cache_clear()
+    _quant_sql.cache_clear()
+    _lookups.cache_clear()
+
+
+@lru_cache(maxsize=1)
+def _quant_sql() -> str:
+    """_QUANT_SQL for the kind of compressed index ingest built."""
+    row = _db().execute("SELECT sql FROM sqlite_master WHERE name = 'symbol_vss_q'").fetchone()
+    if row is None:
+        raise RuntimeError("VECTOR_ENGINE=quantized needs symbol_vss_q: run ingest.py --quantize binary")
+    expr = next((e for col, e in _QUANTIZE_EXPR.items() if col in row[0]), None)
+    if expr is None:
+        raise RuntimeError("symbol_vss_q is not a binary index: run ingest.py --quantize binary")
+    return _QUANT_SQL.format(quantize=expr)
+
+
+def _knn(vectors: list, k: int) -> list[list[tuple]]:
+    """Nearest symbols for each query vector, via the configured VECTOR_ENGINE."""
+    if not vectors:
+        return []
+    if VECTOR_ENGINE == "numpy":
+        return _index().search(np.stack(vectors), k)
+    conn = _db()
+    blobs = [struct.pack(f"{EMBED_DIM}f", *vec) for vec in vectors]
+    if VECTOR_ENGINE == "quantized":
+        sql = _quant_sql()
+        return [conn.execute(sql, (blob, k * QUANT_OVERSAMPLE, blob, k)).fetchall() for blob in blobs]
+    return [conn.execute(_KNN_SQL, (blob, k)).fetchall() for blob in blobs]
+
+
+class EmbeddingCache:
+    """Bounded LRU of text → unit vector, optionally backed by a PersistentCache.
+
+    Keys are whitespace-normalized text. Case is kept: the model is cased, so
+    folding it would change the vectors the thresholds were tuned on."""
+
+    def __init__(self, max_entries: int, persist: PersistentCache | None = None):
+        self.max_entries = max_entries
+        self.persist = persist
+        self.hits = self.misses = 0
+        self._entries: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text: str) -> str:
+        return " ".join(text.split())
+
+    @staticmethod
+    def _persist_key(key: str) -> str:
+        """Vectors differ slightly between models and backends, so both are part of the key."""
+        return f"{EMBED_MODEL}/{EMBED_BACKEND}\n{key}"
+
+    def get_many(self, keys) -> dict[str, np.ndarray]:
+        found: dict[str, np.ndarray] = {}
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[key] = self._entries[key]
+        if self.persist is not None:
+            for key in keys:
+                if key not in found:
+                    blob = self.persist.get(self._persist_key(key))
+                    if blob is not None:
+                        found[key] = np.frombuffer(base64.b64decode(blob), dtype=np.float32)
+                        self._store(key, found[key])
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: dict[str, np.ndarray]):
+        blobs = {}
+        for key, vector in items.items():
+            vector = np.asarray(vector, dtype=np.float32)
+            self._store(key, vector)
+            if self.persist is not None:
+                blobs[self._persist_key(key)] = base64.b64encode(vector.tobytes()).decode()
+        if blobs:
+            self.persist.set_many(blobs)  # one transaction for the whole batch
+
+    def _store(self, key: str, vector: np.ndarray):
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"entries": len(self._entries), "max_entries": self.max_entries,
+                    "hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / total, 4) if total else 0.0}
+
+
+embedding_cache = EmbeddingCache(
+    EMBED_CACHE_SIZE,
+    PersistentCache(EMBED_CACHE_PATH, "embeddings", ttl=EMBED_CACHE_TTL, max_entries=EMBED_CACHE_SIZE * 4)
+    if EMBED_CACHE_PATH else None,
+)
+
+
+def encode_texts(texts, embeddings: dict | None = None) -> dict:
+    """Embed every text not already in `embeddings` in one batched forward pass.
+
+    Texts found in embedding_cache skip the model entirely. Returns the (updated)
+    text → vector mapping."""
+    embeddings = {} if embeddings is None else embeddings
+    missing = list(dict.fromkeys(t for t in texts if t not in embeddings))
+    if missing:
+        keys = {t: EmbeddingCache.key(t) for t in missing}
+        found = embedding_cache.get_many(list(dict.fromkeys(keys.values())))
+        to_encode = [k for k in dict.fromkeys(keys.values()) if k not in found]
+        if to_encode:
+            fresh = dict(zip(to_encode, load_model().encode(to_encode, normalize_embeddings=True)))
+            embedding_cache.put_many(fresh)
+            found.update(fresh)
+        embeddings.update((t, found[keys[t]]) for t in missing)
+    return embeddings
+
+
+def nearest_categories(query: str, n: int, k: int = 60) -> list[str]:
+    """The `n` categories whose symbols rank highest for `query` (first appearance in one KNN)."""
+    vector = encode_texts([query])[query]
+    categories: list[str] = []
+    for row in _knn([vector], k)[0]:
+        if row[1] not in categories:
+            categories.append(row[1])
+            if len(categories) == n:
+                break
+    return categories
+
+
+def _strong_threshold(query: str) -> float:
+    # short queries (≤4 keywords): use looser threshold to catch single-concept matches
+    keywords = [k for k in query.split(",") if k.strip()]
+    return STRONG_THRESHOLD if len(keywords) > 4 else 1.20
+
+
+def _subqueries(query: str, splits: int = KEYWORD_SPLITS) -> list[str]:
+    """The searches retrieve runs: the full query, plus `splits` keyword groups for multi-aspect queries."""
+    keywords = [k.strip() for k in query.split(",") if k.strip()]
+    subs = [query]
+    if len(keywords) >= SPLIT_MIN_KEYWORDS and splits > 1:
+        size, extra = divmod(len(keywords), splits)
+        start = 0
+        for i in range(splits):
+            end = start + size + (i < extra)
+            subs.append(", ".join(keywords[start:end]))
+            start = end
+    return subs
+
+
+def _phrase_misses(parts) -> list[str]:
+    """Phrase concepts no name or alias resolves — these need the vector fallback."""
+    lookups = _lookups()
+    return [
+        concept.strip() for _, concept in list(parts)[:PHRASE_MAX]
+        if concept.strip() and lookups.resolve(concept.strip()) is None
+    ]
+
+
+def plan_embeddings(query: str = "", parts=()) -> list[str]:
+    """Every string one search will embed: the keyword query, its sub-queries
+    and the phrase concepts that miss the exact name lookup."""
+    texts = _subqueries(query) if query.strip() else []
+    return list(dict.fromkeys(texts + _phrase_misses(parts)))
+
+
+def _merge(neighbors: list[list[tuple]]) -> list[dict]:
+    """Pool KNN rows from every sub-query, one entry per symbol at its best distance."""
+    best: dict[tuple[str, str, str], tuple] = {}
+    for rows in neighbors:
+        for row in rows:
+            if row[4] > SYMBOL_THRESHOLD:
+                break  # rows come nearest first
+            key = (row[0], row[1], row[2])
+            if key not in best or row[4] < best[key][4]:
+                best[key] = row
+    return [
         {"display_name": row[0], "category": row[1], "audience": row[2],
          "png_path": _fix_png_path(row[3]), "distance": round(row[4], 4),
-         "display_name_uk": row[5] or row[0], "category_uk": row[6] or row[1]}
-        for row in rows
-        if row[4] <= SYMBOL_THRESHOLD
+         "display_name_uk": row[5] or row[0], "category_uk": row[6] or row[1], "symbol_id": row[7]}
+        for row in sorted(best.values(), key=lambda row: row[4])
     ]
 
+
+def _select(all_results: list[dict], query: str, audience: str | None, strong_threshold: float) -> list[dict]:
+    """Audience preference, category grouping and per-category filters, applied once."""
     if audience is None:
         results = all_results
     else:
@@ -120,7 +557,7 @@ def _query_once(query: str, n_results: int, audience: str | None, strong_thresho
     for r in results:
         by_category[r["category"]].append(r)
 
-    query_lower = query.lower()
+    allowed = _allowed_conditionals(query)
     # sort categories by their best-match distance so most relevant appear first
     sorted_cats = sorted(by_category.values(), key=lambda syms: syms[0]["distance"])
     filtered = []
@@ -130,44 +567,53 @@ def _query_once(query: str, n_results: int, audience: str | None, strong_thresho
             continue
         relevant = [s for s in symbols if s["distance"] <= best + RELATIVE_SPREAD]
         for s in relevant[:MAX_PER_CATEGORY]:
-            triggers = CONDITIONAL_SYMBOLS.get(s["display_name"])
-            if triggers and not any(t in query_lower for t in triggers):
+            if s["display_name"] in CONDITIONAL_SYMBOLS and s["display_name"] not in allowed:
                 continue
             filtered.append(s)
     return filtered
 
 
-def retrieve(query: str, n_results: int = 40, audience: str | None = None) -> list[dict]:
-    """Return pictogram matches grouped by category, filtered by relevance and audience."""
-    keywords = [k.strip() for k in query.split(",") if k.strip()]
+def batch_neighbors(texts: list[str], embeddings: dict, k: int) -> dict[str, list[tuple]]:
+    """KNN rows for many texts in one MatrixIndex product, whatever VECTOR_ENGINE is (bulk jobs).
 
-    # short queries (≤4 keywords): use looser threshold to catch single-concept matches
-    strong = STRONG_THRESHOLD if len(keywords) > 4 else 1.20
+    The result can be passed as `neighbors=` to retrieve and retrieve_phrase."""
+    texts = list(dict.fromkeys(texts))
+    if not texts:
+        return {}
+    return dict(zip(texts, _index().search(np.stack([embeddings[t] for t in texts]), k)))
 
-    results = _query_once(query, n_results, audience, strong)
 
-    # multi-aspect queries: also search each half separately and merge
-    if len(keywords) >= 6:
-        mid = len(keywords) // 2
-        for sub in [", ".join(keywords[:mid]), ", ".join(keywords[mid:])]:
-            for r in _query_once(sub, n_results, audience, STRONG_THRESHOLD):
-                if not any(e["display_name"] == r["display_name"] and e["audience"] == r["audience"]
-                           for e in results):
-                    results.append(r)
+def _neighbors_for(texts: list[str], embeddings: dict, k: int, neighbors: dict | None) -> list[list[tuple]]:
+    """KNN rows per text: taken from precomputed `neighbors` where present, the rest in one _knn call."""
+    known = neighbors or {}
+    missing = [t for t in texts if t not in known]
+    fresh = dict(zip(missing, _knn([embeddings[t] for t in missing], k)))
+    return [known[t][:k] if t in known else fresh[t] for t in texts]
+
+
+def retrieve(
+    query: str, n_results: int = 40, audience: str | None = None, embeddings: dict | None = None,
+    neighbors: dict | None = None,
+) -> list[dict]:
+    """Return pictogram matches grouped by category, filtered by relevance and audience.
+
+    `embeddings` may carry vectors precomputed by encode_texts(plan_embeddings(...));
+    any sub-query missing from it is encoded here in a single batch. `neighbors` may
+    likewise carry KNN rows from batch_neighbors."""
+    subs = _subqueries(query)
+    embeddings = encode_texts(subs, embeddings)
+
+    # every sub-query's KNN in one call (a single matrix product on the numpy engine),
+    # merged into one candidate set and filtered once
+    rows = _neighbors_for(subs, embeddings, n_results, neighbors)
+    results = _select(_merge(rows), query, audience, _strong_threshold(query))
 
     # always inject communication symbols whose exact concept appears in the query
-    query_lower = query.lower()
     existing_names = {r["display_name"] for r in results}
-    conn = _open_db()
-    for trigger_word, patterns in COMMUNICATION_TRIGGERS.items():
-        if trigger_word not in query_lower:
-            continue
-        for pattern in patterns:
-            rows = conn.execute(
-                "SELECT display_name, category, audience, png_path, display_name_uk, category_uk "
-                "FROM symbols WHERE INSTR(symbol_name, ?) > 0",
-                (pattern,),
-            ).fetchall()
+    by_trigger = _lookups().by_trigger
+    for trigger_word in _communication_words(query):
+        for pattern in COMMUNICATION_TRIGGERS[trigger_word]:
+            rows = by_trigger[pattern]
             preferred = [r for r in rows if audience is None or r[2] == audience]
             if not preferred and rows:
                 preferred = rows
@@ -175,49 +621,48 @@ def retrieve(query: str, n_results: int = 40, audience: str | None = None) -> li
                 if row[0] not in existing_names:
                     results.append({"display_name": row[0], "category": row[1],
                                     "audience": row[2], "png_path": _fix_png_path(row[3]), "distance": 0.0,
-                                    "display_name_uk": row[4] or row[0], "category_uk": row[5] or row[1]})
+                                    "display_name_uk": row[4] or row[0], "category_uk": row[5] or row[1],
+                                    "symbol_id": row[6]})
                     existing_names.add(row[0])
-    conn.close()
 
     return results
 
 
-PHRASE_MAX = 5           # max symbols in a phrase strip
-PHRASE_FALLBACK_THRESHOLD = 1.20  # vector search fallback threshold
-
-
 def retrieve_phrase(
     parts: tuple[tuple[str, str], ...] | list[tuple[str, str]],
     audience: str | None = None,
+    embeddings: dict | None = None,
+    neighbors: dict | None = None,
 ) -> list[dict]:
     """Return one pictogram per (role, symbol) pair in phrase order.
-    LLM provides exact symbol names; vector search is a fallback only."""
+    LLM provides exact symbol names; aliases catch near-misses and vector search is a fallback only."""
     if not parts:
         return []
 
+    # encode and search every concept that will need the fallback in one batch up front
+    misses = _phrase_misses(parts)
+    embeddings = encode_texts(misses, embeddings)
+    fallback_rows = dict(zip(misses, _neighbors_for(misses, embeddings, 10, neighbors)))
     seen: set[str] = set()
     phrase: list[dict] = []
-    conn = _open_db()
+    lookups = _lookups()
 
     for role, concept in list(parts)[:PHRASE_MAX]:
         concept = concept.strip()
         if not concept:
             continue
 
-        # 1. Direct display_name lookup — LLM picked an exact symbol name
-        rows = conn.execute(
-            "SELECT display_name, category, audience, png_path, display_name_uk, category_uk "
-            "FROM symbols WHERE display_name = ?",
-            (concept,),
-        ).fetchall()
-        preferred = [r for r in rows if audience is None or r[2] == audience] or rows
+        # 1. display_name lookup — exact name, or an alias of one (casing, "dont", Ukrainian, tags)
+        resolved = lookups.resolve(concept)
+        preferred = lookups.named(resolved, audience) if resolved else []
         matched = False
-        for name, cat, aud, path, name_uk, cat_uk in preferred:
+        for name, cat, aud, path, name_uk, cat_uk, symbol_id in preferred:
             if name not in seen:
                 seen.add(name)
                 phrase.append({"role": role, "display_name": name, "category": cat,
                                "audience": aud, "png_path": _fix_png_path(path), "distance": 0.0,
-                               "display_name_uk": name_uk or name, "category_uk": cat_uk or cat})
+                               "display_name_uk": name_uk or name, "category_uk": cat_uk or cat,
+                               "symbol_id": symbol_id})
                 matched = True
                 break
 
@@ -225,20 +670,11 @@ def retrieve_phrase(
             continue
 
         # 2. Vector search fallback — LLM gave a synonym or near-miss
-        emb = _model.encode(concept, normalize_embeddings=True)
-        blob = struct.pack(f"{EMBED_DIM}f", *emb)
-        vrows = conn.execute(
-            """
-            SELECT s.display_name, s.category, s.audience, s.png_path, v.distance,
-                   s.display_name_uk, s.category_uk
-            FROM symbol_vss v JOIN symbols s ON s.symbol_id = v.symbol_id
-            WHERE v.embedding MATCH ? AND k = 10
-            ORDER BY v.distance
-            """,
-            (blob,),
-        ).fetchall()
+        vrows = fallback_rows.get(concept)
+        if vrows is None:  # name resolved but was already used earlier in the phrase
+            vrows = _knn([encode_texts([concept], embeddings)[concept]], 10)[0]
         for pass_num in range(2):
-            for name, cat, aud, path, dist, name_uk, cat_uk in vrows:
+            for name, cat, aud, path, dist, name_uk, cat_uk, symbol_id in vrows:
                 if dist > PHRASE_FALLBACK_THRESHOLD:
                     break
                 if name in seen:
@@ -248,11 +684,11 @@ def retrieve_phrase(
                 seen.add(name)
                 phrase.append({"role": role, "display_name": name, "category": cat,
                                "audience": aud, "png_path": _fix_png_path(path), "distance": round(dist, 4),
-                               "display_name_uk": name_uk or name, "category_uk": cat_uk or cat})
+                               "display_name_uk": name_uk or name, "category_uk": cat_uk or cat,
+                               "symbol_id": symbol_id})
                 matched = True
                 break
             if matched:
                 break
 
-    conn.close()
     return phrase
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Cache warm-up: push common queries through the search pipeline before serving traffic.
+
+Fills the expansion caches (in-process and expansions.db), loads the model and pooled DB
+connections, and — when run from app.py — the image cache, then reports timings per stage."""
+
+import argparse
+import json
+import statistics
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from llm import expand_query
+from rag import encode_texts, plan_embeddings, retrieve, retrieve_phrase
+
+STAGES = ("expand", "encode", "phrase", "retrieve", "render")
+QUERY_FIELDS = ("query", "q", "text", "title")
+
+
+def load_queries(path: str | Path) -> list[str]:
+    """Queries from a JSONL file (first of QUERY_FIELDS per object) or plain text, one per line."""
+    queries = []
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            obj = json.loads(line)
+        except json.JSONDecodeError:
+            queries.append(line)
+            continue
+        if isinstance(obj, dict):
+            text = next((obj[f] for f in QUERY_FIELDS if isinstance(obj.get(f), str)), "")
+            if text.strip():
+                queries.append(text.strip())
+        elif isinstance(obj, str) and obj.strip():
+            queries.append(obj.strip())
+    return queries
+
+
+def _warm_one(query: str, render) -> dict[str, float]:
+    timings = {}
+    start = time.perf_counter()
+
+    def lap(stage: str):
+        nonlocal start
+        now = time.perf_counter()
+        timings[stage] = (now - start) * 1000
+        start = now
+
+    expanded, parts, audience = expand_query(query)
+    lap("expand")
+    embeddings = encode_texts(plan_embeddings(expanded, parts))
+    lap("encode")
+    phrase = retrieve_phrase(parts, audience, embeddings=embeddings)
+    lap("phrase")
+    results = retrieve(expanded, n_results=40, audience=audience, embeddings=embeddings)
+    lap("retrieve")
+    if render is not None:
+        render(phrase, results)
+        lap("render")
+    return timings
+
+
+def _try_warm_one(query: str, render) -> dict[str, float] | str:
+    """_warm_one's timings, or the error as text: one bad query must not abort the warm-up."""
+    try:
+        return _warm_one(query, render)
+    except Exception as exc:
+        return f"{type(exc).__name__}: {exc}"
+
+
+def warm(queries: list[str], workers: int = 8, render=None) -> tuple[dict[str, list[float]], dict[str, str]]:
+    """Run every query through the pipeline concurrently.
+
+    Returns (stage → per-query ms, query → error). Expansions are bounded by llm.LLM_TIMEOUT
+    and fall back like any search. `render(phrase, results)` is timed as its own stage when given."""
+    queries = list(dict.fromkeys(q.strip() for q in queries if q.strip()))
+    by_stage: dict[str, list[float]] = defaultdict(list)
+    errors: dict[str, str] = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for query, timings in zip(queries, pool.map(lambda q: _try_warm_one(q, render), queries)):
+            if isinstance(timings, str):
+                errors[query] = timings
+                continue
+            for stage, ms in timings.items():
+                by_stage[stage].append(ms)
+    return by_stage, errors
+
+
+def report(by_stage: dict[str, list[float]], elapsed: float, errors: dict[str, str] | None = None):
+    count = max((len(v) for v in by_stage.values()), default=0)
+    print(f"Warmed {count} queries in {elapsed:.1f} s" + (f", {len(errors)} failed" if errors else ""))
+    for query, error in (errors or {}).items():
+        print(f"  failed: {query!r}: {error}")
+    for stage in STAGES:
+        samples = by_stage.get(stage)
+        if samples:
+            print(f"  {stage:<9} median {statistics.median(samples):8.1f} ms   max {max(samples):8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm the search caches with common queries")
+    parser.add_argument("queries", nargs="*", help="JSONL or text files with extra queries")
+    parser.add_argument("--no-examples", action="store_true", help="Skip the app.EXAMPLES queries")
+    parser.add_argument("-j", "--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    queries = []
+    if not args.no_examples:
+        from app import EXAMPLES  # imported late: building the UI is only needed for the list
+        queries += [q for lang in EXAMPLES.values() for q in lang]
+    for path in args.queries:
+        queries += load_queries(path)
+
+    start = time.perf_counter()
+    by_stage, errors = warm(queries, args.workers)
+    report(by_stage, time.perf_counter() - start, errors)
+
+
+if __name__ == "__main__":
+    main()